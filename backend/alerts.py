@@ -0,0 +1,239 @@
+# alerts.py
+"""Incremental hemorrhage classification and alerting.
+
+Each patient keeps a small fixed amount of state that is updated in O(1)
+(amortized) per reading: a least-squares fit of volume against time over the
+last `window_seconds`, an EWMA-smoothed instantaneous rate, and the current
+hemorrhage level. Alerts are produced only when a level or the rapid-bleeding
+flag changes, and thresholds use hysteresis so noise around a boundary does
+not make them flap.
+
+Scale noise is symmetric, so rates are smoothed with their sign and only
+clamped at zero when reported; clamping each noisy sample first would turn
+the noise into phantom bleeding. The rapid-bleeding flag uses the fitted
+slope, which averages over every reading in the window rather than trusting
+its two end points.
+"""
+import itertools
+import math
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import format_timestamp
+
+# (level, minimum blood loss in mL); same boundaries as the dashboard, plus
+# "critical" for massive hemorrhage
+LEVELS = [
+    ("normal", 0.0),
+    ("minor", 100.0),
+    ("moderate", 250.0),
+    ("major", 500.0),
+    ("critical", 1000.0),
+]
+
+LEVEL_ALERT_TYPES = {
+    "normal": "info",
+    "minor": "warning",
+    "moderate": "critical",
+    "major": "emergency",
+    "critical": "emergency",
+}
+
+LEVEL_MESSAGES = {
+    "normal": "Normal bleeding",
+    "minor": "Minor Hemorrhage",
+    "moderate": "Moderate Hemorrhage",
+    "major": "Major Hemorrhage",
+    "critical": "Massive Hemorrhage",
+}
+
+_alert_ids = itertools.count(1)
+
+
+class PatientState:
+    """Running per-patient values; everything here is O(1) to update"""
+
+    __slots__ = ("window", "ref_ts", "sum_t", "sum_v", "sum_tt", "sum_tv", "last_ts", "last_volume",
+                 "peak_ml", "smoothed_rate", "window_rate", "level", "rapid", "last_seen")
+
+    def __init__(self):
+        self.window: deque = deque()
+        # Running sums for the least-squares fit, with t in seconds since ref_ts
+        self.ref_ts = 0
+        self.sum_t = 0.0
+        self.sum_v = 0.0
+        self.sum_tt = 0.0
+        self.sum_tv = 0.0
+        self.last_ts: Optional[int] = None
+        self.last_volume = 0.0
+        self.peak_ml = 0.0
+        self.smoothed_rate = 0.0
+        self.window_rate = 0.0
+        self.level = 0
+        self.rapid = False
+        self.last_seen = 0.0
+
+    @property
+    def level_name(self) -> str:
+        return LEVELS[self.level][0]
+
+    @property
+    def smoothed_rate_ml_min(self) -> float:
+        return max(0.0, self.smoothed_rate)
+
+    def as_dict(self, patient_id: str) -> dict:
+        return {
+            "patient_id": patient_id,
+            "hemorrhage_level": self.level_name,
+            "blood_loss_ml": self.last_volume,
+            "peak_blood_loss_ml": self.peak_ml,
+            "smoothed_rate_ml_min": round(self.smoothed_rate_ml_min, 2),
+            "window_rate_ml_min": round(self.window_rate, 2),
+            "rapid_bleeding": self.rapid,
+            "last_reading": format_timestamp(self.last_ts) if self.last_ts is not None else None,
+        }
+
+
+class HemorrhageEngine:
+    """Classifies every patient's bleeding as readings arrive"""
+
+    def __init__(self, window_seconds: float = 60, ewma_tau_seconds: float = 30,
+                 hysteresis_ml: float = 20, rapid_rate_ml_min: float = 10,
+                 rapid_hysteresis: float = 0.7, idle_seconds: float = 7200):
+        self.window_ms = int(window_seconds * 1000)
+        # The fitted slope is too noisy to act on until it spans this much
+        self.min_fit_ms = self.window_ms // 2
+        self.tau_ms = ewma_tau_seconds * 1000
+        self.hysteresis_ml = hysteresis_ml
+        self.rapid_on = rapid_rate_ml_min
+        self.rapid_off = rapid_rate_ml_min * rapid_hysteresis
+        self.idle_seconds = idle_seconds
+        self.patients: Dict[str, PatientState] = {}
+        self._last_sweep = 0.0
+
+    def __len__(self) -> int:
+        return len(self.patients)
+
+    def state(self, patient_id: str) -> Optional[PatientState]:
+        return self.patients.get(patient_id)
+
+    def warm(self, rows: Iterable[Tuple[str, float, float, float]]):
+        """Replay (patient_id, epoch, volume, rate) rows read from storage, oldest first.
+
+        Restores levels and rates after a restart without raising alerts, so
+        patients who were already bleeding are not alerted on again.
+        """
+        for patient_id, ts, volume_ml, _ in rows:
+            self.update(patient_id, round(ts * 1000), volume_ml)
+
+    def update(self, patient_id: str, ts_ms: int, volume_ml: float) -> Tuple[PatientState, List[dict]]:
+        """Fold one reading into the patient's state; returns the state and any new alerts"""
+        now = time.time()
+        state = self.patients.get(patient_id)
+        if state is None:
+            state = self.patients[patient_id] = PatientState()
+        state.last_seen = now
+
+        if state.last_ts is not None and ts_ms <= state.last_ts:
+            # Late or duplicate reading; the rates already moved past it
+            return state, []
+
+        if state.last_ts is not None:
+            dt_ms = ts_ms - state.last_ts
+            instant = (volume_ml - state.last_volume) * 60_000 / dt_ms
+            # Time-aware EWMA so irregular sampling weighs readings fairly
+            alpha = 1.0 - math.exp(-dt_ms / self.tau_ms)
+            state.smoothed_rate += alpha * (instant - state.smoothed_rate)
+
+        window = state.window
+        if not window or ts_ms - state.ref_ts > 3_600_000:
+            self._rebase(state, ts_ms)
+        window.append((ts_ms, volume_ml))
+        self._fit_add(state, ts_ms, volume_ml, 1)
+        cutoff = ts_ms - self.window_ms
+        while window[0][0] < cutoff:
+            old_ts, old_volume = window.popleft()
+            self._fit_add(state, old_ts, old_volume, -1)
+        if ts_ms - window[0][0] >= self.min_fit_ms:
+            state.window_rate = max(0.0, self._slope(state) * 60)
+        else:
+            state.window_rate = 0.0
+
+        state.last_ts = ts_ms
+        state.last_volume = volume_ml
+        state.peak_ml = max(state.peak_ml, volume_ml)
+
+        alerts = []
+        level = self._classify(state.level, volume_ml)
+        if level != state.level:
+            state.level = level
+            name = state.level_name
+            alerts.append(self._alert(patient_id, state, LEVEL_ALERT_TYPES[name], LEVEL_MESSAGES[name]))
+
+        rapid = state.window_rate >= self.rapid_on if not state.rapid else state.window_rate > self.rapid_off
+        if rapid != state.rapid:
+            state.rapid = rapid
+            if rapid:
+                message = f"Rapid bleeding: {state.window_rate:.1f} mL/min"
+                alerts.append(self._alert(patient_id, state, "critical", message))
+            else:
+                alerts.append(self._alert(patient_id, state, "info", "Bleeding rate back below threshold"))
+
+        if now - self._last_sweep > 60:
+            self._last_sweep = now
+            self.evict_idle(now)
+
+        return state, alerts
+
+    @staticmethod
+    def _fit_add(state: PatientState, ts_ms: int, volume_ml: float, sign: int):
+        t = (ts_ms - state.ref_ts) / 1000
+        state.sum_t += sign * t
+        state.sum_v += sign * volume_ml
+        state.sum_tt += sign * t * t
+        state.sum_tv += sign * t * volume_ml
+
+    def _rebase(self, state: PatientState, ts_ms: int):
+        # Keeps t small so the running sums do not lose precision or drift
+        state.ref_ts = ts_ms
+        state.sum_t = state.sum_v = state.sum_tt = state.sum_tv = 0.0
+        for old_ts, old_volume in state.window:
+            self._fit_add(state, old_ts, old_volume, 1)
+
+    @staticmethod
+    def _slope(state: PatientState) -> float:
+        """Least-squares mL per second over the window"""
+        n = len(state.window)
+        denominator = n * state.sum_tt - state.sum_t * state.sum_t
+        if n < 3 or denominator <= 0:
+            return 0.0
+        return (n * state.sum_tv - state.sum_t * state.sum_v) / denominator
+
+    def _classify(self, current: int, volume_ml: float) -> int:
+        level = current
+        while level + 1 < len(LEVELS) and volume_ml >= LEVELS[level + 1][1]:
+            level += 1
+        # Only step down once clearly below the boundary
+        while level > 0 and volume_ml < LEVELS[level][1] - self.hysteresis_ml:
+            level -= 1
+        return level
+
+    def _alert(self, patient_id: str, state: PatientState, alert_type: str, message: str) -> dict:
+        return {
+            "alert_id": f"alert_{patient_id}_{state.last_ts}_{next(_alert_ids)}",
+            "patient_id": patient_id,
+            "alert_type": alert_type,
+            "message": message,
+            "hemorrhage_level": state.level_name,
+            "blood_loss_ml": state.last_volume,
+            "rate_ml_min": round(state.smoothed_rate_ml_min, 2),
+            "timestamp": format_timestamp(state.last_ts),
+            "acknowledged": False,
+        }
+
+    def evict_idle(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        idle = [pid for pid, state in self.patients.items() if now - state.last_seen >= self.idle_seconds]
+        for patient_id in idle:
+            del self.patients[patient_id]
@@ -0,0 +1,356 @@
+# benchmark.py
+"""Repeatable performance benchmarks for the HemoDrop backend.
+
+Runs the ASGI app in-process (no network, no uvicorn) against a throwaway
+database and reports:
+
+  * ingest throughput and p50/p99 latency of POST /api/data and /api/data/batch
+  * reading-to-WebSocket delivery latency across N subscribers
+  * /api/history latency (raw, bucketed, LTTB) versus stored readings
+
+Usage:
+    python benchmark.py
+    python benchmark.py --json > baseline.json
+    python benchmark.py --baseline baseline.json   # exits 1 on a p99 regression
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# The app reads its configuration at import time
+_tmpdir = tempfile.TemporaryDirectory(prefix="hemodrop-bench-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir.name, "bench.db")
+os.environ.setdefault("RETENTION_INTERVAL_SECONDS", "86400")
+
+# Keep the app's startup chatter out of the report
+with contextlib.redirect_stdout(sys.stderr):
+    import main  # noqa: E402
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> dict:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+# Minimal in-process ASGI clients
+async def http_request(app, method: str, path: str, body: Optional[object] = None, query: str = ""):
+    """Send one HTTP request straight to the ASGI app; returns (status, body bytes)"""
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    sent = False
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await asyncio.Event().wait()  # Never disconnects
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+class WebSocketClient:
+    """An in-process WebSocket connection to the ASGI app"""
+
+    def __init__(self, app, path: str = "/ws"):
+        self.app = app
+        self.path = path
+        self.inbound: asyncio.Queue = asyncio.Queue()
+        self.outbound: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": self.path,
+            "raw_path": self.path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        await self.inbound.put({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(scope, self.inbound.get, self.outbound.put))
+        message = await self.outbound.get()
+        if message["type"] != "websocket.accept":
+            raise RuntimeError(f"WebSocket not accepted: {message}")
+
+    async def send_json(self, message: dict):
+        await self.inbound.put({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def receive_json(self) -> dict:
+        message = await self.outbound.get()
+        if message["type"] != "websocket.send":
+            raise RuntimeError(f"WebSocket closed: {message}")
+        return json.loads(message["text"])
+
+    async def close(self):
+        await self.inbound.put({"type": "websocket.disconnect", "code": 1000})
+        if self.task is not None:
+            await asyncio.wait_for(self.task, 5)
+
+
+def reading(patient_id: str, timestamp: float, volume_ml: float) -> dict:
+    return {"patient_id": patient_id, "timestamp": timestamp, "volume_ml": volume_ml, "rate_ml_min": 5.0}
+
+
+# Benchmarks
+async def bench_ingest(app, requests: int, concurrency: int, patients: int) -> dict:
+    latencies: List[float] = []
+    counter = iter(range(requests))
+    start_ts = time.time()
+    errors = 0
+
+    async def producer():
+        nonlocal errors
+        for i in counter:
+            body = reading(f"bench_ingest_{i % patients:03d}", start_ts + i / 1000, i * 0.01)
+            t0 = time.perf_counter()
+            status, _ = await http_request(app, "POST", "/api/data", body)
+            latencies.append(time.perf_counter() - t0)
+            if status != 200:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(producer() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        **summarize(latencies),
+    }
+
+
+async def bench_batch_ingest(app, readings: int, batch_size: int) -> dict:
+    latencies: List[float] = []
+    start_ts = time.time() - 3600
+    t0 = time.perf_counter()
+    for offset in range(0, readings, batch_size):
+        batch = [reading("bench_batch", start_ts + i / 1000, i * 0.01)
+                 for i in range(offset, min(readings, offset + batch_size))]
+        t1 = time.perf_counter()
+        status, _ = await http_request(app, "POST", "/api/data/batch", batch)
+        latencies.append(time.perf_counter() - t1)
+        if status != 200:
+            raise RuntimeError(f"Batch ingest failed with HTTP {status}")
+    elapsed = time.perf_counter() - t0
+    return {
+        "readings": readings,
+        "batch_size": batch_size,
+        "throughput_readings_per_s": round(readings / elapsed, 1),
+        **summarize(latencies),
+    }
+
+
+async def bench_delivery(app, subscribers: int, messages: int, interval: float) -> dict:
+    """Time from POST /api/data to the real_time_data frame on each subscriber"""
+    patient_id = "bench_ws"
+    sent_at: Dict[int, float] = {}
+    latencies: List[float] = []
+    clients = []
+    for _ in range(subscribers):
+        client = WebSocketClient(app)
+        await client.connect()
+        await client.receive_json()  # connection_established
+        await client.send_json({"type": "subscribe_patient", "patient_id": patient_id})
+        await client.receive_json()  # subscribed
+        await client.receive_json()  # snapshot
+        clients.append(client)
+
+    async def reader(client: WebSocketClient):
+        while True:
+            message = await client.receive_json()
+            if message.get("type") != "real_time_data":
+                continue
+            # The sequence number travels in volume_ml
+            seq = int(message["data"]["volume_ml"])
+            latencies.append(time.perf_counter() - sent_at[seq])
+            if seq == messages - 1:
+                return
+
+    readers = [asyncio.create_task(reader(client)) for client in clients]
+    start_ts = time.time() - 7200
+    for seq in range(messages):
+        sent_at[seq] = time.perf_counter()
+        await http_request(app, "POST", "/api/data", reading(patient_id, start_ts + seq, float(seq)))
+        await asyncio.sleep(interval)
+    try:
+        await asyncio.wait_for(asyncio.gather(*readers), 10)
+    except asyncio.TimeoutError:
+        for task in readers:
+            task.cancel()
+    for client in clients:
+        await client.close()
+
+    expected = subscribers * messages
+    return {
+        "subscribers": subscribers,
+        "messages": messages,
+        "delivered": len(latencies),
+        "delivery_ratio": round(len(latencies) / expected, 4) if expected else 0.0,
+        **summarize(latencies),
+    }
+
+
+async def bench_history(app, db, sizes: List[int], repeats: int) -> dict:
+    """History latency for a 24 h window holding `size` readings"""
+    results = {}
+    now_ms = int(time.time() * 1000)
+    span_ms = 24 * 3600 * 1000 - 60_000
+    queries = {
+        "raw": "",
+        "bucket_600": "max_points=600",
+        "lttb_600": "max_points=600&method=lttb",
+    }
+    for size in sizes:
+        patient_id = f"bench_history_{size}"
+        step = span_ms / size
+        rows = [(patient_id, now_ms - span_ms + int(i * step), now_ms, i * 0.01, 5.0) for i in range(size)]
+        for offset in range(0, size, 10_000):
+            await db.insert_readings(rows[offset:offset + 10_000])
+        results[size] = {}
+        for name, query in queries.items():
+            latencies = []
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                status, _ = await http_request(app, "GET", f"/api/history/{patient_id}", query=f"hours=24&{query}")
+                latencies.append(time.perf_counter() - t0)
+                if status != 200:
+                    raise RuntimeError(f"History query {name} failed with HTTP {status}")
+            results[size][name] = summarize(latencies)
+    return results
+
+
+async def run(args) -> dict:
+    app = main.app
+    async with app.router.lifespan_context(app):
+        results = {
+            "ingest": await bench_ingest(app, args.requests, args.concurrency, args.patients),
+            "batch_ingest": await bench_batch_ingest(app, args.requests, args.batch_size),
+            "ws_delivery": await bench_delivery(app, args.subscribers, args.messages, args.interval),
+            "history": await bench_history(app, app.state.db, args.sizes, args.repeats),
+        }
+    return results
+
+
+def p99_values(results: dict, prefix: str = ""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if "p99_ms" in value:
+                yield f"{prefix}{key}", value["p99_ms"]
+            else:
+                yield from p99_values(value, f"{prefix}{key}.")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Names of benchmarks whose p99 grew by more than `tolerance` (a fraction)"""
+    # JSON turns the history size keys into strings
+    current = dict(p99_values(json.loads(json.dumps(results))))
+    regressions = []
+    for name, before in p99_values(baseline):
+        after = current.get(name)
+        if after is not None and before > 0 and after > before * (1 + tolerance):
+            regressions.append(f"{name}: p99 {before:.3f} ms -> {after:.3f} ms")
+    return regressions
+
+
+def print_report(results: dict):
+    ingest = results["ingest"]
+    print(f"POST /api/data        {ingest['throughput_rps']:>10} req/s  "
+          f"p50 {ingest['p50_ms']} ms  p99 {ingest['p99_ms']} ms  errors {ingest['errors']}")
+    batch = results["batch_ingest"]
+    print(f"POST /api/data/batch  {batch['throughput_readings_per_s']:>10} readings/s  "
+          f"p50 {batch['p50_ms']} ms  p99 {batch['p99_ms']} ms")
+    ws = results["ws_delivery"]
+    print(f"WS delivery           {ws['subscribers']} subscribers  delivered {ws['delivered']} "
+          f"({ws['delivery_ratio']:.2%})  p50 {ws['p50_ms']} ms  p99 {ws['p99_ms']} ms")
+    for size, queries in results["history"].items():
+        line = "  ".join(f"{name} p50 {q['p50_ms']} / p99 {q['p99_ms']} ms" for name, q in queries.items())
+        print(f"History {size:>8} rows  {line}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the HemoDrop backend in-process")
+    parser.add_argument("--requests", type=int, default=5000, help="Readings to ingest")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent producers")
+    parser.add_argument("--patients", type=int, default=100, help="Patients the producers report for")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--subscribers", type=int, default=100, help="WebSocket subscribers")
+    parser.add_argument("--messages", type=int, default=200, help="Readings sent to the subscribers")
+    parser.add_argument("--interval", type=float, default=0.005, help="Seconds between those readings")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="Stored readings per history benchmark")
+    parser.add_argument("--repeats", type=int, default=20, help="Queries per history benchmark")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare p99 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p99 growth over the baseline")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,124 @@
+# cache.py
+"""In-memory cache of each patient's most recent readings.
+
+Readings live in fixed-size ring buffers backed by `array('d')` columns
+(epoch seconds, volume, rate), so a patient costs 24 bytes per reading no
+matter how many readings arrive. Patients that stop reporting are evicted.
+"""
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+
+class PatientRingBuffer:
+    """Fixed-capacity ring of (epoch, volume_ml, rate_ml_min) sorted by time"""
+
+    __slots__ = ("capacity", "ts", "volume", "rate", "start", "size", "complete_since", "last_seen")
+
+    def __init__(self, capacity: int, complete_since: float):
+        self.capacity = capacity
+        self.ts = array('d', bytes(8 * capacity))
+        self.volume = array('d', bytes(8 * capacity))
+        self.rate = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.size = 0
+        # Every reading newer than this is in the buffer
+        self.complete_since = complete_since
+        self.last_seen = 0.0
+
+    def append(self, ts: float, volume_ml: float, rate_ml_min: float):
+        self.last_seen = time.time()
+        if self.size and ts < self.ts[(self.start + self.size - 1) % self.capacity]:
+            # Late (re-sent) reading: keep the ring sorted and let older
+            # windows fall through to storage instead
+            self.complete_since = max(self.complete_since, ts)
+            return
+        if self.size < self.capacity:
+            i = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            i = self.start
+            self.complete_since = max(self.complete_since, self.ts[i])
+            self.start = (self.start + 1) % self.capacity
+        self.ts[i] = ts
+        self.volume[i] = volume_ml
+        self.rate[i] = rate_ml_min
+
+    def covers(self, since: float) -> bool:
+        return since >= self.complete_since
+
+    def _ordered(self, column: array) -> array:
+        end = self.start + self.size
+        if end <= self.capacity:
+            return column[self.start:end]
+        return column[self.start:] + column[:end - self.capacity]
+
+    def window(self, since: float) -> Tuple[array, array, array]:
+        """Columns of readings with ts > since, oldest first"""
+        ts = self._ordered(self.ts)
+        first = bisect_right(ts, since)
+        return ts[first:], self._ordered(self.volume)[first:], self._ordered(self.rate)[first:]
+
+
+class RecentReadingsCache:
+    """Per-patient ring buffers with LRU bound and idle eviction"""
+
+    def __init__(self, capacity: int = 4096, max_patients: int = 256, idle_seconds: float = 7200):
+        self.capacity = capacity
+        self.max_patients = max_patients
+        self.idle_seconds = idle_seconds
+        self.buffers: "OrderedDict[str, PatientRingBuffer]" = OrderedDict()
+        # New buffers are only complete from this point on (warm-up horizon,
+        # then the time of the latest eviction)
+        self.complete_since = time.time()
+        self._last_sweep = 0.0
+
+    def __len__(self) -> int:
+        return len(self.buffers)
+
+    def warm(self, rows: Iterable[Tuple[str, float, float, float]], since: float):
+        """Load (patient_id, epoch, volume, rate) rows read from storage, oldest first"""
+        self.buffers.clear()
+        self.complete_since = since
+        for patient_id, ts, volume_ml, rate_ml_min in rows:
+            self.append(patient_id, ts, volume_ml, rate_ml_min)
+
+    def append(self, patient_id: str, ts: float, volume_ml: float, rate_ml_min: float):
+        buffer = self.buffers.get(patient_id)
+        if buffer is None:
+            buffer = PatientRingBuffer(self.capacity, self.complete_since)
+            self.buffers[patient_id] = buffer
+            if len(self.buffers) > self.max_patients:
+                self._evict(next(iter(self.buffers)))
+        else:
+            self.buffers.move_to_end(patient_id)
+        buffer.append(ts, volume_ml, rate_ml_min)
+
+        now = buffer.last_seen
+        if now - self._last_sweep > 60:
+            self._last_sweep = now
+            self.evict_idle(now)
+
+    def evict_idle(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        # Buffers are in least-recently-written order
+        while self.buffers:
+            patient_id, buffer = next(iter(self.buffers.items()))
+            if now - buffer.last_seen < self.idle_seconds:
+                break
+            self._evict(patient_id)
+
+    def _evict(self, patient_id: str):
+        del self.buffers[patient_id]
+        self.complete_since = time.time()
+
+    def window(self, patient_id: str, since: float) -> Optional[Tuple[array, array, array]]:
+        """Readings newer than `since`, or None if the cache cannot answer completely"""
+        buffer = self.buffers.get(patient_id)
+        if buffer is None:
+            return ([], [], []) if since >= self.complete_since else None
+        if not buffer.covers(since):
+            return None
+        return buffer.window(since)
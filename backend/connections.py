@@ -0,0 +1,195 @@
+# connections.py
+"""WebSocket fan-out for real-time updates.
+
+Each client gets its own bounded send queue drained by a dedicated writer
+task, so a slow tablet only ever delays itself. Messages are serialized once
+per broadcast and only delivered to clients subscribed to that patient.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import deque
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket
+
+from metrics import WS_MESSAGES_COALESCED, WS_MESSAGES_DROPPED, WS_MESSAGES_SENT, WS_SEND_LAG_SECONDS
+
+log = logging.getLogger("hemodrop.ws")
+_client_ids = itertools.count(1)
+
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+
+
+class ClientConnection:
+    """One WebSocket client with a bounded outgoing queue and a writer task"""
+
+    def __init__(self, websocket: WebSocket, max_queue: int, policy: str):
+        self.id = next(_client_ids)
+        self.websocket = websocket
+        self.policy = policy
+        self.subscriptions: Set[str] = set()
+        self.dropped = 0
+        # Entries are (coalesce_key, [text], enqueued_at, critical); the
+        # one-item list lets a newer message for the same key replace a pending
+        # one in place while keeping its place (and age) in the queue.
+        self._pending: deque = deque()
+        self._max_queue = max_queue
+        self._latest: Dict[str, list] = {}
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, on_error):
+        self._task = asyncio.create_task(self._writer(on_error))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def send_lag(self) -> float:
+        """Seconds the oldest pending message has been waiting"""
+        return time.monotonic() - self._pending[0][2] if self._pending else 0.0
+
+    def enqueue(self, text: str, key: Optional[str] = None, critical: bool = False):
+        """Queue a message; critical ones (alerts) are never evicted to make room"""
+        if key is not None and self.policy == COALESCE:
+            box = self._latest.get(key)
+            if box is not None:
+                box[0] = text
+                WS_MESSAGES_COALESCED.inc()
+                return
+        if len(self._pending) >= self._max_queue:
+            self._evict()
+        box = [text]
+        self._pending.append((key, box, time.monotonic(), critical))
+        if key is not None and self.policy == COALESCE:
+            self._latest[key] = box
+        self._ready.set()
+
+    def _evict(self):
+        """Drop the oldest reading, else the oldest other non-critical message.
+
+        Readings are superseded by the next one, so they go first. A queue
+        holding only critical messages may grow past max_queue; they are only
+        raised on state changes, so this stays small.
+        """
+        victim = None
+        for index, (key, _, _, critical) in enumerate(self._pending):
+            if critical:
+                continue
+            if key is not None:
+                victim = index
+                break
+            if victim is None:
+                victim = index
+        if victim is None:
+            return
+        old_key, old_box, _, _ = self._pending[victim]
+        del self._pending[victim]
+        if old_key is not None and self._latest.get(old_key) is old_box:
+            del self._latest[old_key]
+        self.dropped += 1
+        WS_MESSAGES_DROPPED.inc()
+
+    async def _writer(self, on_error):
+        try:
+            while True:
+                while not self._pending:
+                    self._ready.clear()
+                    await self._ready.wait()
+                key, box, enqueued_at, _ = self._pending.popleft()
+                if key is not None and self._latest.get(key) is box:
+                    del self._latest[key]
+                WS_SEND_LAG_SECONDS.observe(time.monotonic() - enqueued_at)
+                await self.websocket.send_text(box[0])
+                WS_MESSAGES_SENT.inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            on_error(self.websocket)
+
+
+class ConnectionManager:
+    """Tracks clients and their patient subscriptions.
+
+    Clients that have not subscribed to any patient receive every patient's
+    updates, which keeps older dashboards working unchanged.
+    """
+
+    def __init__(self, max_queue: int = 256, policy: str = DROP_OLDEST):
+        self.max_queue = max_queue
+        self.policy = policy
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.subscribers: Dict[str, Set[ClientConnection]] = {}
+        self.unsubscribed: Set[ClientConnection] = set()
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        client = ClientConnection(websocket, self.max_queue, self.policy)
+        self.connections[websocket] = client
+        self.unsubscribed.add(client)
+        client.start(self.disconnect)
+        log.info("WebSocket connected", extra={"client": client.id, "connections": len(self.connections)})
+        return client
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.connections.pop(websocket, None)
+        if client is None:
+            return
+        client.stop()
+        self.unsubscribed.discard(client)
+        for patient_id in client.subscriptions:
+            self._remove_subscriber(patient_id, client)
+        log.info("WebSocket disconnected", extra={"client": client.id, "connections": len(self.connections),
+                                                  "dropped": client.dropped})
+
+    def subscribe(self, client: ClientConnection, patient_id: str):
+        client.subscriptions.add(patient_id)
+        self.unsubscribed.discard(client)
+        self.subscribers.setdefault(patient_id, set()).add(client)
+
+    def unsubscribe(self, client: ClientConnection, patient_id: str):
+        if patient_id in client.subscriptions:
+            client.subscriptions.discard(patient_id)
+            self._remove_subscriber(patient_id, client)
+        if not client.subscriptions:
+            self.unsubscribed.add(client)
+
+    def _remove_subscriber(self, patient_id: str, client: ClientConnection):
+        clients = self.subscribers.get(patient_id)
+        if clients is not None:
+            clients.discard(client)
+            if not clients:
+                del self.subscribers[patient_id]
+
+    def send(self, client: ClientConnection, message: dict):
+        client.enqueue(json.dumps(message))
+
+    def broadcast(self, message: dict, patient_id: Optional[str] = None, coalesce: bool = True):
+        """Queue a message for every interested client without waiting on any of them.
+
+        With coalesce=False the message must be delivered (use it for alerts):
+        it is never replaced by a newer one and never dropped when a client's
+        queue overflows.
+        """
+        text = json.dumps(message)
+        critical = not coalesce
+        if patient_id is None:
+            for client in self.connections.values():
+                client.enqueue(text, critical=critical)
+            return
+        key = f"{message.get('type')}:{patient_id}" if coalesce else None
+        for client in self.subscribers.get(patient_id, ()):
+            client.enqueue(text, key, critical)
+        for client in self.unsubscribed:
+            client.enqueue(text, key, critical)
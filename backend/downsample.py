@@ -0,0 +1,43 @@
+# downsample.py
+"""Shape-preserving downsampling for chart data"""
+from typing import List, Sequence
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets: pick `threshold` indices that keep the shape of ys(xs).
+
+    Returns indices into the input so callers can keep every column of the
+    selected rows. The first and last points are always kept.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    selected = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        count = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / count
+        avg_y = sum(ys[avg_start:avg_end]) / count
+
+        # Pick the point in this bucket forming the largest triangle with a
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        dx, dy = ax - avg_x, avg_y - ay
+        best, best_area = range_start, -1.0
+        for j in range(range_start, range_end):
+            area = abs(dx * (ys[j] - ay) - (ax - xs[j]) * dy)
+            if area > best_area:
+                best, best_area = j, area
+
+        selected.append(best)
+        a = best
+
+    selected.append(n - 1)
+    return selected
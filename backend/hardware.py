@@ -0,0 +1,188 @@
+# hardware.py
+"""Binary ingest channel for bedside devices.
+
+Devices keep one WebSocket open on /ws/device and stream fixed-layout frames
+instead of POSTing a JSON document per reading. A binary message is a batch
+of back-to-back frames; the server answers every binary message with one
+binary ack per device that appeared in it. An ack carries the highest
+sequence number below which nothing is missing, the highest sequence number
+it accounts for, and the ranges still missing in between, so the device can
+drop what was stored and re-send only the gaps. When there are more gaps
+than fit in one ack, the accounted-for range ends before the first gap left
+out, and the device keeps everything above it.
+
+The layouts below must match hardware/sensors.py.
+"""
+import logging
+import struct
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# device_id u32, seq u32, epoch ms i64, volume_ml f32, rate_ml_min f32
+FRAME = struct.Struct("<IIqff")
+# device_id u32, contiguous seq u32, highest seq covered by the gaps u32, gap count u16
+ACK_HEADER = struct.Struct("<IIIH")
+# first and last missing seq of one gap, inclusive
+ACK_GAP = struct.Struct("<II")
+
+log = logging.getLogger("hemodrop.devices")
+
+
+def decode_frames(payload: bytes, max_frames: int) -> Iterator[Tuple[int, int, int, float, float]]:
+    """Iterate (device_id, seq, ts_ms, volume, rate) without copying the payload"""
+    view = memoryview(payload)
+    if not view.nbytes or view.nbytes % FRAME.size:
+        raise ValueError(f"Message of {view.nbytes} bytes is not a whole number of {FRAME.size}-byte frames")
+    if view.nbytes // FRAME.size > max_frames:
+        raise ValueError(f"Message has more than {max_frames} frames")
+    return FRAME.iter_unpack(view)
+
+
+class SequenceTracker:
+    """Which sequence numbers one device has delivered.
+
+    Sequence numbers start at 1. Everything up to `contiguous` has arrived;
+    `received` holds the out-of-order arrivals above it. If a gap stays open
+    for more than `window` sequence numbers it is given up on and counted
+    as lost, which keeps the state bounded.
+    """
+
+    __slots__ = ("contiguous", "highest", "received", "window", "lost")
+
+    def __init__(self, first_seq: int, window: int):
+        self.contiguous = first_seq - 1
+        self.highest = first_seq - 1
+        self.received: Set[int] = set()
+        self.window = window
+        self.lost = 0
+
+    def add(self, seq: int) -> bool:
+        """Record a sequence number; False if it was already delivered"""
+        if seq <= self.contiguous or seq in self.received:
+            return False
+        self.received.add(seq)
+        if seq > self.highest:
+            self.highest = seq
+        floor = self.highest - self.window
+        if floor > self.contiguous:
+            stale = [s for s in self.received if s <= floor]
+            self.lost += floor - self.contiguous - len(stale)
+            self.received.difference_update(stale)
+            self.contiguous = floor
+        while self.contiguous + 1 in self.received:
+            self.contiguous += 1
+            self.received.remove(self.contiguous)
+        return True
+
+    def gaps(self, limit: int) -> Tuple[List[Tuple[int, int]], int]:
+        """At most `limit` missing (first, last) ranges above `contiguous`, oldest first.
+
+        Also returns the highest sequence number the ranges account for:
+        `highest` if they are all listed, otherwise the last one before the
+        first range left out. Anything above it may still be missing.
+        """
+        gaps = []
+        expected = self.contiguous + 1
+        for seq in sorted(self.received):
+            if seq > expected:
+                if len(gaps) == limit:
+                    return gaps, expected - 1
+                gaps.append((expected, seq - 1))
+            expected = seq + 1
+        return gaps, self.highest
+
+
+class DeviceRegistry:
+    """Device-to-patient bindings and per-device sequence tracking.
+
+    Unbound devices report under "device_<id>" so their readings are never
+    lost, just filed under a placeholder patient until a bind arrives.
+    Devices are forgotten after `idle_seconds` without a bind or frame, and
+    the least recently active ones once there are more than `max_devices`,
+    so made-up device ids cannot grow the registry without bound.
+    """
+
+    def __init__(self, window: int = 4096, max_ack_gaps: int = 64, max_devices: int = 10000,
+                 idle_seconds: float = 7200):
+        self.window = window
+        self.max_ack_gaps = max_ack_gaps
+        self.max_devices = max_devices
+        self.idle_seconds = idle_seconds
+        self.bindings: Dict[int, str] = {}
+        self.trackers: Dict[int, SequenceTracker] = {}
+        # device_id -> time of its last bind or frame, least recent first
+        self.last_seen: "OrderedDict[int, float]" = OrderedDict()
+        self.frames = 0
+        self.duplicates = 0
+        self._lost = 0
+        self._last_sweep = 0.0
+
+    def __len__(self) -> int:
+        return len(self.trackers)
+
+    def bind(self, device_id: int, patient_id: str):
+        self._touch(device_id)
+        self.bindings[device_id] = patient_id
+        # A (re)connecting device re-sends everything unacked, oldest first,
+        # so tracking restarts cleanly after a reboot resets its counter
+        self.trackers.pop(device_id, None)
+
+    def patient_id(self, device_id: int) -> str:
+        patient_id = self.bindings.get(device_id)
+        return patient_id if patient_id is not None else f"device_{device_id}"
+
+    def accept(self, device_id: int, seq: int) -> bool:
+        """True if the frame is new and should be ingested"""
+        self.frames += 1
+        self._touch(device_id)
+        tracker = self.trackers.get(device_id)
+        if tracker is None:
+            tracker = self.trackers[device_id] = SequenceTracker(max(seq, 1), self.window)
+        lost = tracker.lost
+        if seq == 0 or not tracker.add(seq):
+            self.duplicates += 1
+            return False
+        self._lost += tracker.lost - lost
+        return True
+
+    def lost(self) -> int:
+        """Frames written off since startup, including forgotten devices'"""
+        return self._lost
+
+    def _touch(self, device_id: int):
+        now = time.time()
+        self.last_seen[device_id] = now
+        self.last_seen.move_to_end(device_id)
+        if len(self.last_seen) > self.max_devices:
+            oldest = next(iter(self.last_seen))
+            log.warning("Too many devices, forgetting the least recently active", extra={"device_id": oldest})
+            self._forget(oldest)
+        if now - self._last_sweep > 60:
+            self._last_sweep = now
+            self.evict_idle(now)
+
+    def evict_idle(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        while self.last_seen:
+            device_id, last_seen = next(iter(self.last_seen.items()))
+            if now - last_seen < self.idle_seconds:
+                break
+            self._forget(device_id)
+
+    def _forget(self, device_id: int):
+        del self.last_seen[device_id]
+        self.bindings.pop(device_id, None)
+        self.trackers.pop(device_id, None)
+
+    def ack(self, device_ids: Iterable[int]) -> bytes:
+        parts = []
+        for device_id in device_ids:
+            tracker = self.trackers.get(device_id)
+            if tracker is None:
+                continue
+            gaps, covered = tracker.gaps(self.max_ack_gaps)
+            parts.append(ACK_HEADER.pack(device_id, tracker.contiguous, covered, len(gaps)))
+            for first, last in gaps:
+                parts.append(ACK_GAP.pack(first, last))
+        return b"".join(parts)
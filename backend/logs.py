@@ -0,0 +1,107 @@
+# logs.py
+"""Asynchronous, structured, rate-limited logging.
+
+Calling a logger only fills in the message and puts the record on a queue;
+a QueueListener thread renders it as JSON and writes it to stderr, so the
+event loop never blocks on a slow terminal or pipe. A token bucket per call
+site drops floods (a reconnect storm, a failing disk) before they reach the
+queue; the next record that gets through reports how many were suppressed.
+
+Extra fields go in `extra=`; they become top-level JSON keys:
+
+    log.info("Device bound", extra={"device_id": 7, "patient_id": "p1"})
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from metrics import LOG_SUPPRESSED
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_FIELDS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve args and the traceback while they are still valid; the
+        # JSON itself is built on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per (logger, message template); errors are limited too"""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        super().__init__()
+        self.rate = rate_per_second
+        self.burst = burst
+        # key -> (tokens, last refill, suppressed since last emitted)
+        self._buckets: Dict[Tuple[str, str], Tuple[float, float, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        tokens, last, suppressed = self._buckets.get(key, (self.burst, now, 0))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now, suppressed + 1)
+            LOG_SUPPRESSED.inc()
+            return False
+        if suppressed:
+            record.suppressed = suppressed
+        self._buckets[key] = (tokens - 1, now, 0)
+        return True
+
+
+def setup_logging(level: str = "INFO", rate_per_second: float = 5, burst: int = 20):
+    """Send every "hemodrop.*" logger through one background writer thread"""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter())
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(RateLimitFilter(rate_per_second, burst))
+
+    root = logging.getLogger("hemodrop")
+    root.setLevel(level.upper())
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
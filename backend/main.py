@@ -1,74 +1,169 @@
 # main.py
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional, Tuple
 from contextlib import asynccontextmanager
+import asyncio
+import csv
+import io
 import json
-import sqlite3
+import logging
+import math
+import re
 import uvicorn
 from datetime import datetime
 import os
 import random
 import time
 
+from alerts import HemorrhageEngine
+from cache import RecentReadingsCache
+from connections import ConnectionManager
+from downsample import lttb
+from hardware import DeviceRegistry, decode_frames
+from logs import setup_logging
+from metrics import ALERTS_RAISED, READINGS_INGESTED, REGISTRY, LoopLagMonitor
+from models import (
+    Database, RetentionTask, SeriesKeys, WriteBehindQueue, decode_cursor, encode_cursor, format_timestamp,
+)
+from profiler import SamplingProfiler
+from simulation import PROFILES, SimulatedDevice, SimulationEngine
+
 # Environment configuration (simplified - no dotenv required)
 IS_SIMULATION = os.environ.get("SIMULATION_MODE", "true").lower() == "true"
 BACKEND_HOST = os.environ.get("BACKEND_HOST", "0.0.0.0")
 BACKEND_PORT = int(os.environ.get("BACKEND_PORT", "8000"))
 
-print(f"Starting in {'SIMULATION' if IS_SIMULATION else 'PRODUCTION'} mode")
+# Database configuration
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "hemodrop.db")
+DB_READER_THREADS = int(os.environ.get("DB_READER_THREADS", "4"))
 
-# Database initialization
-def init_db():
-    try:
-        conn = sqlite3.connect('hemodrop.db', check_same_thread=False)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS patient_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                patient_id TEXT NOT NULL,
-                volume_ml REAL NOT NULL,
-                rate_ml_min REAL NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_patient_timestamp 
-            ON patient_data(patient_id, timestamp)
-        ''')
-        
-        conn.commit()
-        conn.close()
-        print("Database initialized successfully")
-    except Exception as e:
-        print(f"Error initializing database: {e}")
+# Ingest write-behind queue: rows are committed per batch or per interval,
+# whichever comes first. A full queue blocks producers (backpressure).
+INGEST_QUEUE_MAX = int(os.environ.get("INGEST_QUEUE_MAX", "10000"))
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_MS = int(os.environ.get("INGEST_FLUSH_MS", "200"))
+# A batch that fails to commit is retried this many times in total, with the
+# delay starting at INGEST_RETRY_BACKOFF_MS and doubling, before it is dropped
+INGEST_RETRY_ATTEMPTS = int(os.environ.get("INGEST_RETRY_ATTEMPTS", "5"))
+INGEST_RETRY_BACKOFF_MS = int(os.environ.get("INGEST_RETRY_BACKOFF_MS", "100"))
+
+# WebSocket fan-out: per-client send queue size and what to do when it is
+# full ("drop_oldest" or "coalesce" to the latest reading per patient)
+WS_SEND_QUEUE_MAX = int(os.environ.get("WS_SEND_QUEUE_MAX", "256"))
+WS_SLOW_CONSUMER_POLICY = os.environ.get("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+
+# Recent-readings cache: ring buffer size per patient, patient limit, idle
+# eviction, how much history to load at startup, and the /ws snapshot size
+CACHE_CAPACITY = int(os.environ.get("CACHE_CAPACITY", "4096"))
+CACHE_MAX_PATIENTS = int(os.environ.get("CACHE_MAX_PATIENTS", "256"))
+CACHE_IDLE_SECONDS = int(os.environ.get("CACHE_IDLE_SECONDS", "7200"))
+CACHE_WARM_HOURS = float(os.environ.get("CACHE_WARM_HOURS", "1"))
+SNAPSHOT_SECONDS = int(os.environ.get("SNAPSHOT_SECONDS", "3600"))
+SNAPSHOT_MAX_POINTS = int(os.environ.get("SNAPSHOT_MAX_POINTS", "600"))
+
+# Retention: raw readings and per-minute rollups are purged after these many
+# days; per-hour rollups are kept. 0 (the default) keeps everything, so
+# purging clinical data is always an explicit choice
+RETENTION_RAW_DAYS = float(os.environ.get("RETENTION_RAW_DAYS", "0"))
+RETENTION_MINUTE_ROLLUP_DAYS = float(os.environ.get("RETENTION_MINUTE_ROLLUP_DAYS", "0"))
+RETENTION_INTERVAL_SECONDS = int(os.environ.get("RETENTION_INTERVAL_SECONDS", "3600"))
+
+# Hemorrhage engine: rate window, EWMA time constant, how far below a level
+# boundary blood loss must fall to step down, and the rapid-bleeding threshold
+ALERT_RATE_WINDOW_SECONDS = float(os.environ.get("ALERT_RATE_WINDOW_SECONDS", "60"))
+ALERT_EWMA_TAU_SECONDS = float(os.environ.get("ALERT_EWMA_TAU_SECONDS", "30"))
+ALERT_HYSTERESIS_ML = float(os.environ.get("ALERT_HYSTERESIS_ML", "20"))
+ALERT_RAPID_RATE_ML_MIN = float(os.environ.get("ALERT_RAPID_RATE_ML_MIN", "10"))
+
+# Rows fetched per round trip while streaming an export
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "2000"))
+
+# Binary device channel: frames per message, how far a sequence gap may trail
+# before it is written off, and gap ranges reported per ack
+DEVICE_MAX_FRAMES = int(os.environ.get("DEVICE_MAX_FRAMES", "4096"))
+DEVICE_SEQ_WINDOW = int(os.environ.get("DEVICE_SEQ_WINDOW", "4096"))
+DEVICE_MAX_ACK_GAPS = int(os.environ.get("DEVICE_MAX_ACK_GAPS", "64"))
+# Devices tracked at once and how long an idle device's binding and
+# sequence state are kept
+DEVICE_MAX_DEVICES = int(os.environ.get("DEVICE_MAX_DEVICES", "10000"))
+DEVICE_IDLE_SECONDS = int(os.environ.get("DEVICE_IDLE_SECONDS", "7200"))
+
+# Device timestamps further than this from server time mean a broken clock
+# (or milliseconds sent as seconds); the default still admits a week of
+# readings buffered while offline
+CLOCK_MAX_AHEAD_SECONDS = float(os.environ.get("CLOCK_MAX_AHEAD_SECONDS", "300"))
+CLOCK_MAX_BEHIND_SECONDS = float(os.environ.get("CLOCK_MAX_BEHIND_SECONDS", "604800"))
+
+# Logging: JSON lines on stderr, at most LOG_RATE_PER_SECOND records per call
+# site after an initial burst
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_RATE_PER_SECOND = float(os.environ.get("LOG_RATE_PER_SECOND", "5"))
+LOG_BURST = int(os.environ.get("LOG_BURST", "20"))
+ACCESS_LOG = os.environ.get("ACCESS_LOG", "false").lower() == "true"
+
+# How often the event loop lag monitor samples
+LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+# The /debug/profiler endpoints expose stacks and can load a production
+# server, so they answer 404 unless explicitly enabled
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "false").lower() == "true"
+# Upper bound on one sampling profiler run
+PROFILER_MAX_SECONDS = float(os.environ.get("PROFILER_MAX_SECONDS", "300"))
+
+setup_logging(LOG_LEVEL, LOG_RATE_PER_SECOND, LOG_BURST)
+log = logging.getLogger("hemodrop.api")
+log.info("Starting", extra={"mode": "simulation" if IS_SIMULATION else "production"})
 
 # Lifespan event handler (replaces deprecated on_event)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    init_db()
-    print("=" * 50)
-    print("HemoDrop Backend started successfully!")
-    print(f"Mode: {'SIMULATION' if IS_SIMULATION else 'PRODUCTION'}")
-    print(f"URL: http://{BACKEND_HOST}:{BACKEND_PORT}")
-    print("Available endpoints:")
-    print("  GET  / - API information")
-    print("  GET  /health - Health check")
-    print("  POST /api/data - Receive data from Pico")
-    print("  WS   /ws - WebSocket for real-time updates")
-    print("  GET  /api/history/{patient_id} - Get historical data")
-    if IS_SIMULATION:
-        print("  POST /api/simulate - Generate test data")
-    print("=" * 50)
+    db = Database(DATABASE_PATH, readers=DB_READER_THREADS)
+    try:
+        await db.open()
+        log.info("Database initialized", extra={"path": DATABASE_PATH})
+    except Exception:
+        log.exception("Error initializing database")
+        raise
+    warm_since = time.time() - CACHE_WARM_HOURS * 3600
+    recent = await db.fetch_recent(warm_since)
+    await asyncio.to_thread(cache.warm, recent, warm_since)
+    await asyncio.to_thread(engine.warm, recent)
+    log.info("Cache warmed", extra={"readings": len(recent), "patients": len(cache)})
+    ingest_queue = WriteBehindQueue(db, INGEST_QUEUE_MAX, INGEST_BATCH_SIZE, INGEST_FLUSH_MS,
+                                    INGEST_RETRY_ATTEMPTS, INGEST_RETRY_BACKOFF_MS)
+    await ingest_queue.start()
+    retention = RetentionTask(db, RETENTION_INTERVAL_SECONDS, RETENTION_RAW_DAYS, RETENTION_MINUTE_ROLLUP_DAYS)
+    await retention.start()
+
+    async def ingest_simulated(patient_id: str, timestamp: float, volume_ml: float, rate_ml_min: float):
+        data = PatientData(volume_ml=volume_ml, rate_ml_min=rate_ml_min, timestamp=timestamp, patient_id=patient_id)
+        await ingest_reading(data, ingest_queue, "simulation")
+
+    simulation = SimulationEngine(ingest_simulated)
+    loop_lag = LoopLagMonitor(LOOP_LAG_INTERVAL_SECONDS)
+    await loop_lag.start()
+    app.state.db = db
+    app.state.ingest_queue = ingest_queue
+    app.state.simulation = simulation
+    # The full endpoint list is served at GET /
+    log.info("HemoDrop Backend started", extra={
+        "mode": "simulation" if IS_SIMULATION else "production",
+        "url": f"http://{BACKEND_HOST}:{BACKEND_PORT}"
+    })
     
     yield
     
-    # Shutdown (cleanup if needed)
-    print("Shutting down HemoDrop Backend...")
+    # Shutdown
+    log.info("Shutting down HemoDrop Backend")
+    profiler.stop()
+    await loop_lag.stop()
+    await simulation.stop()
+    await retention.stop()
+    await ingest_queue.stop()
+    await db.close()
 
 # Initialize FastAPI app with lifespan
 app = FastAPI(title="HemoDrop Backend", version="1.0.0", lifespan=lifespan)
@@ -90,37 +185,69 @@ class PatientData(BaseModel):
     patient_id: str
 
 class SimulatedDataRequest(BaseModel):
-    duration_minutes: int = 10
-    max_volume: int = 500
-    patient_id: str = "test_patient_001"
+    duration_minutes: float = Field(10, ge=0)  # 0 runs until stopped
+    max_volume: float = Field(500, gt=0)
+    patient_id: str = "test_patient_001"  # with several devices, used as a prefix
+    devices: int = Field(1, ge=1, le=5000)
+    interval_seconds: float = Field(1.0, gt=0)
+    jitter_seconds: float = Field(0.1, ge=0)
+    profile: str = "ramp"  # a simulation profile, or "mixed" for a random one per device
 
 # WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"New WebSocket connection. Total: {len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        print(f"WebSocket disconnected. Total: {len(self.active_connections)}")
-
-    async def broadcast(self, message: dict):
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception:
-                disconnected.append(connection)
-        
-        for connection in disconnected:
-            self.disconnect(connection)
+manager = ConnectionManager(max_queue=WS_SEND_QUEUE_MAX, policy=WS_SLOW_CONSUMER_POLICY)
+cache = RecentReadingsCache(CACHE_CAPACITY, CACHE_MAX_PATIENTS, CACHE_IDLE_SECONDS)
+engine = HemorrhageEngine(
+    window_seconds=ALERT_RATE_WINDOW_SECONDS,
+    ewma_tau_seconds=ALERT_EWMA_TAU_SECONDS,
+    hysteresis_ml=ALERT_HYSTERESIS_ML,
+    rapid_rate_ml_min=ALERT_RAPID_RATE_ML_MIN,
+    idle_seconds=CACHE_IDLE_SECONDS
+)
+series_keys = SeriesKeys(idle_seconds=CACHE_IDLE_SECONDS)
+devices = DeviceRegistry(window=DEVICE_SEQ_WINDOW, max_ack_gaps=DEVICE_MAX_ACK_GAPS,
+                         max_devices=DEVICE_MAX_DEVICES, idle_seconds=DEVICE_IDLE_SECONDS)
+profiler = SamplingProfiler()
+
+# Metrics that mirror existing state are read at scrape time
+def _client_send_lag():
+    return [((client.id,), client.send_lag()) for client in manager.connections.values()]
+
+REGISTRY.gauge("hemodrop_ingest_queue_depth", "Readings waiting for the write-behind queue",
+               callback=lambda: app.state.ingest_queue.qsize())
+REGISTRY.gauge("hemodrop_db_pending_writes", "Calls queued or running on the SQLite writer thread",
+               callback=lambda: app.state.db.pending_writes)
+REGISTRY.gauge("hemodrop_db_pending_reads", "Calls queued or running on the SQLite reader threads",
+               callback=lambda: app.state.db.pending_reads)
+REGISTRY.gauge("hemodrop_ws_connections", "Connected dashboard WebSockets", callback=lambda: len(manager))
+REGISTRY.gauge("hemodrop_ws_send_queue_depth", "Messages waiting in all WebSocket send queues",
+               callback=lambda: sum(client.queue_depth() for client in manager.connections.values()))
+REGISTRY.gauge("hemodrop_ws_client_send_lag_seconds", "Age of the oldest message waiting for each WebSocket",
+               ["client"], callback=_client_send_lag)
+REGISTRY.gauge("hemodrop_cached_patients", "Patients held in the recent-readings cache", callback=lambda: len(cache))
+REGISTRY.gauge("hemodrop_tracked_patients", "Patients tracked by the hemorrhage engine", callback=lambda: len(engine))
+REGISTRY.gauge("hemodrop_streaming_devices", "Devices seen on the binary ingest channel", callback=lambda: len(devices))
+REGISTRY.counter("hemodrop_device_frames_total", "Frames received on the binary ingest channel",
+                 callback=lambda: devices.frames)
+REGISTRY.counter("hemodrop_device_frames_duplicate_total", "Re-sent frames that had already been stored",
+                 callback=lambda: devices.duplicates)
+REGISTRY.counter("hemodrop_device_frames_lost_total", "Sequence numbers given up on after a gap aged out",
+                 callback=devices.lost)
+clock_rejected = REGISTRY.counter(
+    "hemodrop_readings_clock_skew_total", "Readings whose device timestamp was too far from server time",
+    ["action"])
+clock_clamped = clock_rejected.labels("clamped")
+# Bound once so the hot path skips the label lookup
+ingested = {source: READINGS_INGESTED.labels(source) for source in ("http", "batch", "device", "simulation")}
+
+# Dependencies
+def get_db(request: Request) -> Database:
+    return request.app.state.db
+
+def get_ingest_queue(request: Request) -> WriteBehindQueue:
+    return request.app.state.ingest_queue
 
-manager = ConnectionManager()
+def get_simulation(request: Request) -> SimulationEngine:
+    return request.app.state.simulation
 
 # API endpoints
 @app.get("/")
@@ -133,159 +260,512 @@ async def root():
             "root": "GET /",
             "health": "GET /health",
             "receive_data": "POST /api/data",
+            "receive_batch": "POST /api/data/batch",
             "websocket": "WS /ws",
+            "device_stream": "WS /ws/device",
             "history": "GET /api/history/{patient_id}",
-            "simulate": "POST /api/simulate"
+            "readings": "GET /api/readings/{patient_id}",
+            "export": "GET /api/export/{patient_id}",
+            "status": "GET /api/status/{patient_id}",
+            "metrics": "GET /metrics",
+            "simulate": "POST /api/simulate",
+            "simulate_stop": "POST /api/simulate/stop",
+            "simulate_status": "GET /api/simulate",
+            **({"profiler": "GET /debug/profiler"} if PROFILER_ENABLED else {})
         }
     }
 
 @app.get("/health")
-async def health_check():
+async def health_check(ingest_queue: WriteBehindQueue = Depends(get_ingest_queue)):
     return {
         "status": "healthy", 
         "timestamp": datetime.now().isoformat(),
         "mode": "simulation" if IS_SIMULATION else "production",
-        "active_connections": len(manager.active_connections)
+        "active_connections": len(manager),
+        "ingest_queue_depth": ingest_queue.qsize(),
+        "cached_patients": len(cache),
+        "tracked_patients": len(engine),
+        "streaming_devices": len(devices)
     }
 
-@app.post("/api/data")
-async def receive_data(data: PatientData):
-    try:
-        print(f"Received data: {data.dict()}")
-        
-        # Store in database
-        conn = sqlite3.connect('hemodrop.db', check_same_thread=False)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO patient_data (patient_id, volume_ml, rate_ml_min, timestamp)
-            VALUES (?, ?, ?, datetime('now'))
-        ''', (data.patient_id, data.volume_ml, data.rate_ml_min))
-        
-        conn.commit()
-        conn.close()
-        
-        # Broadcast to WebSocket clients
-        message = {
-            "type": "real_time_data",
-            "data": {
-                "patient_id": data.patient_id,
-                "volume_ml": data.volume_ml,
-                "rate_ml_min": data.rate_ml_min,
-                "timestamp": datetime.now().isoformat()
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def require_profiler_enabled():
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.post("/debug/profiler/start", dependencies=[Depends(require_profiler_enabled)])
+async def start_profiler(
+    interval_ms: float = Query(10, ge=1, le=1000),
+    duration_seconds: float = Query(60, gt=0)
+):
+    """Sample every thread's stack until stopped or duration_seconds elapse"""
+    duration = min(duration_seconds, PROFILER_MAX_SECONDS)
+    await asyncio.to_thread(profiler.start, interval_ms, duration)
+    log.info("Profiler started", extra={"interval_ms": interval_ms, "duration_seconds": duration})
+    return profiler.report()
+
+@app.post("/debug/profiler/stop", dependencies=[Depends(require_profiler_enabled)])
+async def stop_profiler():
+    await asyncio.to_thread(profiler.stop)
+    return profiler.report()
+
+@app.get("/debug/profiler", dependencies=[Depends(require_profiler_enabled)])
+async def profiler_report(
+    format: str = Query("json", pattern="^(json|folded)$"),
+    limit: int = Query(25, ge=1, le=500)
+):
+    """Hottest frames as JSON, or every stack in flamegraph "folded" format"""
+    if format == "folded":
+        return PlainTextResponse(profiler.folded())
+    return profiler.report(limit)
+
+def format_time(timestamp: str) -> str:
+    return timestamp[11:19]
+
+def send_snapshot(client, patient_id: str):
+    """Send a new subscriber the patient's recent readings straight from the cache"""
+    window = cache.window(patient_id, time.time() - SNAPSHOT_SECONDS)
+    ts, volume, rate = window if window is not None else ([], [], [])
+    indices = lttb(ts, volume, SNAPSHOT_MAX_POINTS)
+    manager.send(client, {
+        "type": "snapshot",
+        "patient_id": patient_id,
+        "complete": window is not None,
+        "data": [
+            {
+                "patient_id": patient_id,
+                "volume_ml": volume[i],
+                "rate_ml_min": rate[i],
+                "timestamp": format_timestamp(ts[i] * 1000)
             }
+            for i in indices
+        ]
+    })
+
+def timestamp_error(timestamp: float, now: float) -> Optional[str]:
+    """Why a device timestamp (epoch seconds, 0 for no clock) cannot be used, or None"""
+    if not math.isfinite(timestamp):
+        return "timestamp must be a finite number of epoch seconds"
+    if timestamp <= 0:
+        return None
+    if timestamp > now + CLOCK_MAX_AHEAD_SECONDS:
+        return f"timestamp {timestamp} is more than {CLOCK_MAX_AHEAD_SECONDS:g}s ahead of server time"
+    if timestamp < now - CLOCK_MAX_BEHIND_SECONDS:
+        return f"timestamp {timestamp} is more than {CLOCK_MAX_BEHIND_SECONDS:g}s behind server time"
+    return None
+
+async def ingest_reading(data: PatientData, ingest_queue: WriteBehindQueue, source: str = "http"):
+    """Queue a reading for storage and broadcast it without waiting on disk"""
+    ts_ms = int(data.timestamp * 1000) if data.timestamp > 0 else 0
+    await ingest_sample(data.patient_id, ts_ms, data.volume_ml, data.rate_ml_min, ingest_queue, source)
+
+async def ingest_sample(patient_id: str, ts_ms: int, volume_ml: float, rate_ml_min: float,
+                        ingest_queue: WriteBehindQueue, source: str = "http"):
+    ingested[source].inc()
+    received_ms = int(time.time() * 1000)
+    if ts_ms > 0 and timestamp_error(ts_ms / 1000, received_ms / 1000) is not None:
+        # HTTP readings were already rejected; a device stream's clock is
+        # ignored rather than letting the key land years away
+        clock_clamped.inc()
+        log.warning("Device clock out of range, using receive time",
+                    extra={"patient_id": patient_id, "ts_ms": ts_ms, "received_ms": received_ms})
+        ts_ms = 0
+    # Device time is the series key; fall back to receive time if the device has no clock
+    ts_ms = series_keys.key(patient_id, ts_ms, received_ms)
+    await ingest_queue.put((patient_id, ts_ms, received_ms, volume_ml, rate_ml_min))
+    cache.append(patient_id, ts_ms / 1000, volume_ml, rate_ml_min)
+    state, alerts = engine.update(patient_id, ts_ms, volume_ml)
+
+    # Broadcast to WebSocket clients
+    message = {
+        "type": "real_time_data",
+        "data": {
+            "patient_id": patient_id,
+            "volume_ml": volume_ml,
+            "rate_ml_min": rate_ml_min,
+            "timestamp": format_timestamp(ts_ms),
+            "hemorrhage_level": state.level_name,
+            "smoothed_rate_ml_min": round(state.smoothed_rate_ml_min, 2)
         }
-        
-        await manager.broadcast(message)
-        
+    }
+
+    manager.broadcast(message, patient_id)
+    for alert in alerts:
+        ALERTS_RAISED.labels(alert["alert_type"]).inc()
+        manager.broadcast({"type": "alert", "data": alert}, patient_id, coalesce=False)
+
+@app.post("/api/data")
+async def receive_data(data: PatientData, ingest_queue: WriteBehindQueue = Depends(get_ingest_queue)):
+    error = timestamp_error(data.timestamp, time.time())
+    if error is not None:
+        clock_rejected.labels("rejected").inc()
+        raise HTTPException(status_code=422, detail=error)
+    try:
+        await ingest_reading(data, ingest_queue)
+
         return {
             "status": "success",
-            "message": "Data received and stored successfully",
+            "message": "Data received and queued for storage",
             "received_data": data.dict()
         }
-        
+
     except Exception as e:
-        print(f"Error processing data: {e}")
+        log.exception("Error processing data")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/api/data/batch")
+async def receive_data_batch(batch: List[PatientData], ingest_queue: WriteBehindQueue = Depends(get_ingest_queue)):
+    now = time.time()
+    errors = [
+        {"index": i, "error": error}
+        for i, error in ((i, timestamp_error(data.timestamp, now)) for i, data in enumerate(batch))
+        if error is not None
+    ]
+    if errors:
+        # All or nothing, so the device can fix its clock and re-send the batch
+        clock_rejected.labels("rejected").inc(len(errors))
+        raise HTTPException(status_code=422, detail=errors)
+    try:
+        for data in batch:
+            await ingest_reading(data, ingest_queue, "batch")
+
+        return {
+            "status": "success",
+            "message": f"{len(batch)} readings received and queued for storage",
+            "received": len(batch)
+        }
+
+    except Exception as e:
+        log.exception("Error processing batch")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    client = await manager.connect(websocket)
     try:
-        await websocket.send_json({
+        manager.send(client, {
             "type": "connection_established",
             "message": "Connected to HemoDrop WebSocket",
             "timestamp": datetime.now().isoformat(),
             "mode": "simulation" if IS_SIMULATION else "production"
         })
-        
+
         while True:
-            await websocket.receive_text()  # Keep connection alive
-            
+            text = await websocket.receive_text()
+            try:
+                request = json.loads(text)
+            except ValueError:
+                continue
+            if not isinstance(request, dict):
+                continue
+
+            message_type = request.get("type")
+            patient_ids = request.get("patient_ids") or [request.get("patient_id")]
+            patient_ids = [str(p) for p in patient_ids if p is not None]
+
+            if message_type == "subscribe_patient":
+                for patient_id in patient_ids:
+                    manager.subscribe(client, patient_id)
+                manager.send(client, {"type": "subscribed", "patient_ids": sorted(client.subscriptions)})
+                for patient_id in patient_ids:
+                    send_snapshot(client, patient_id)
+            elif message_type == "unsubscribe_patient":
+                for patient_id in patient_ids:
+                    manager.unsubscribe(client, patient_id)
+                manager.send(client, {"type": "subscribed", "patient_ids": sorted(client.subscriptions)})
+            elif message_type == "ping":
+                manager.send(client, {"type": "pong"})
+
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        log.warning("WebSocket error", extra={"client": client.id, "error": str(e)})
         manager.disconnect(websocket)
 
+@app.websocket("/ws/device")
+async def device_stream(websocket: WebSocket):
+    """Binary ingest: batches of struct-packed frames in, one binary ack per batch out"""
+    await websocket.accept()
+    ingest_queue = websocket.app.state.ingest_queue
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            payload = message.get("bytes")
+            if payload is not None:
+                seen = {}
+                try:
+                    for device_id, seq, ts_ms, volume_ml, rate_ml_min in decode_frames(payload, DEVICE_MAX_FRAMES):
+                        seen[device_id] = None
+                        if devices.accept(device_id, seq):
+                            # f32 carries ~7 significant digits; keep the 0.01 mL devices report
+                            await ingest_sample(devices.patient_id(device_id), ts_ms, round(volume_ml, 2),
+                                                round(rate_ml_min, 2), ingest_queue, "device")
+                except ValueError as e:
+                    log.warning("Rejected device message", extra={"error": str(e)})
+                # Always answer, even with an empty ack, so devices can pair acks with batches
+                await websocket.send_bytes(devices.ack(seen))
+                continue
+
+            try:
+                request = json.loads(message.get("text") or "")
+            except ValueError:
+                continue
+            if isinstance(request, dict) and request.get("type") == "bind":
+                try:
+                    device_id = int(request["device_id"])
+                    patient_id = str(request["patient_id"])
+                except (KeyError, TypeError, ValueError):
+                    await websocket.send_text(json.dumps({"type": "error", "message": "bind needs device_id and patient_id"}))
+                    continue
+                devices.bind(device_id, patient_id)
+                await websocket.send_text(json.dumps({"type": "bound", "device_id": device_id, "patient_id": patient_id}))
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log.warning("Device stream error", extra={"error": str(e)})
+
 @app.get("/api/history/{patient_id}")
-async def get_patient_history(patient_id: str, hours: int = 24):
+async def get_patient_history(
+    patient_id: str,
+    hours: int = Query(24, ge=1),
+    resolution: Optional[int] = Query(None, ge=1, description="Bucket width in seconds"),
+    max_points: Optional[int] = Query(None, ge=3, le=10000, description="Upper bound on returned points"),
+    method: str = Query("bucket", pattern="^(bucket|lttb)$"),
+    db: Database = Depends(get_db)
+):
+    """Raw readings, or at most max_points time buckets / LTTB-selected readings"""
+    if method == "lttb" and max_points is None:
+        raise HTTPException(status_code=400, detail="method=lttb requires max_points")
+    if method == "bucket" and resolution is None and max_points is not None:
+        # Buckets start on a boundary at or before since, so the window can
+        # touch one more bucket than it spans
+        resolution = max(1, math.ceil(hours * 3600 / (max_points - 1)))
+
+    since = time.time() - hours * 3600
+    since_ms = int(since * 1000)
     try:
-        conn = sqlite3.connect('hemodrop.db', check_same_thread=False)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT volume_ml, rate_ml_min, timestamp 
-            FROM patient_data 
-            WHERE patient_id = ? AND timestamp > datetime('now', ?)
-            ORDER BY timestamp ASC
-        ''', (patient_id, f'-{hours} hours'))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
         history = []
-        for row in rows:
-            volume_ml, rate_ml_min, timestamp = row
-            history.append({
-                "volume_ml": volume_ml,
-                "rate_ml_min": rate_ml_min,
-                "timestamp": timestamp,
-                "time": timestamp.split(' ')[1] if ' ' in timestamp else timestamp
-            })
-        
+        source = "database"
+        if method == "bucket" and resolution is not None:
+            rows = await db.fetch_history_buckets(patient_id, since_ms, resolution)
+            for row in rows:
+                (bucket_ms, readings, volume_min, volume_max, volume_mean, volume_last,
+                 rate_min, rate_max, rate_mean, rate_last) = row
+                timestamp = format_timestamp(bucket_ms)
+                history.append({
+                    "volume_ml": volume_last,
+                    "rate_ml_min": rate_mean,
+                    "timestamp": timestamp,
+                    "time": format_time(timestamp),
+                    "readings": readings,
+                    "volume_min": volume_min,
+                    "volume_max": volume_max,
+                    "volume_mean": volume_mean,
+                    "volume_last": volume_last,
+                    "rate_min": rate_min,
+                    "rate_max": rate_max,
+                    "rate_mean": rate_mean,
+                    "rate_last": rate_last
+                })
+        else:
+            # Recent windows are answered from the in-memory ring buffers
+            window = cache.window(patient_id, since)
+            if window is not None:
+                source = "cache"
+                ts, volume, rate = window
+                indices = lttb(ts, volume, max_points) if method == "lttb" else range(len(ts))
+                rows = [(volume[i], rate[i], ts[i] * 1000) for i in indices]
+            elif method == "lttb":
+                rows = await db.fetch_history_lttb(patient_id, since_ms, max_points)
+            else:
+                rows = await db.fetch_history(patient_id, since_ms)
+            for row in rows:
+                volume_ml, rate_ml_min, ts_ms = row
+                timestamp = format_timestamp(ts_ms)
+                history.append({
+                    "volume_ml": volume_ml,
+                    "rate_ml_min": rate_ml_min,
+                    "timestamp": timestamp,
+                    "time": format_time(timestamp)
+                })
+
         return {
             "patient_id": patient_id,
             "time_range_hours": hours,
+            "method": method if (method == "lttb" or resolution is not None) else "raw",
+            "resolution_seconds": resolution if method == "bucket" else None,
+            "source": source,
             "data_points": len(history),
             "history": history
         }
-        
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving history: {str(e)}")
 
-@app.post("/api/simulate")
-async def simulate_data(request: SimulatedDataRequest):
-    """Generate simulated data for testing"""
+@app.get("/api/status/{patient_id}")
+async def get_patient_status(patient_id: str):
+    """Current classification from the hemorrhage engine"""
+    state = engine.state(patient_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"No recent readings for patient {patient_id}")
+    return state.as_dict(patient_id)
+
+# Largest SQLite integer: the position (received_ms, MAX_TS_MS) is after
+# every reading received at or before received_ms
+MAX_TS_MS = 2**63 - 1
+
+def keyset_start(since: Optional[float], cursor: Optional[str]) -> Tuple[int, int]:
+    """(received_ms, ts) position to read after: a cursor wins over since
+    (epoch seconds the server received readings at, inclusive)"""
+    if cursor:
+        try:
+            return decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if since is not None:
+        return int(since * 1000) - 1, MAX_TS_MS
+    return -1, MAX_TS_MS
+
+def reading_record(patient_id: str, row: tuple) -> dict:
+    received_ms, ts_ms, volume_ml, rate_ml_min = row
+    return {
+        "patient_id": patient_id,
+        "ts": ts_ms,
+        "timestamp": format_timestamp(ts_ms),
+        "volume_ml": volume_ml,
+        "rate_ml_min": rate_ml_min,
+        "cursor": encode_cursor((received_ms, ts_ms))
+    }
+
+@app.get("/api/readings/{patient_id}")
+async def get_patient_readings(
+    patient_id: str,
+    since: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Database = Depends(get_db)
+):
+    """One page of readings in the order they arrived; pass next_cursor back to
+    fetch only rows stored since, including late readings with older timestamps"""
+    after = keyset_start(since, cursor)
+    try:
+        rows = await db.fetch_page(patient_id, after, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving readings: {str(e)}")
+
+    readings = [reading_record(patient_id, row) for row in rows]
+    return {
+        "patient_id": patient_id,
+        "data_points": len(readings),
+        "readings": readings,
+        "next_cursor": readings[-1]["cursor"] if readings else encode_cursor(after),
+        "has_more": len(rows) == limit
+    }
+
+@app.get("/api/export/{patient_id}")
+async def export_patient_history(
+    patient_id: str,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    since: Optional[float] = None,
+    cursor: Optional[str] = None,
+    db: Database = Depends(get_db)
+):
+    """Stream a patient's full history in keyset-ordered chunks"""
+    after = keyset_start(since, cursor)
+    columns = ["cursor", "patient_id", "ts", "timestamp", "volume_ml", "rate_ml_min"]
+
+    async def generate():
+        position = after
+        if export_format == "csv":
+            yield ",".join(columns) + "\r\n"
+        while True:
+            rows = await db.fetch_page(patient_id, position, EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            chunk = io.StringIO()
+            if export_format == "csv":
+                writer = csv.writer(chunk)
+                for row in rows:
+                    record = reading_record(patient_id, row)
+                    writer.writerow([record[column] for column in columns])
+            else:
+                for row in rows:
+                    chunk.write(json.dumps(reading_record(patient_id, row)))
+                    chunk.write("\n")
+            yield chunk.getvalue()
+            if len(rows) < EXPORT_CHUNK_SIZE:
+                break
+            position = rows[-1][0], rows[-1][1]
+
+    extension = "csv" if export_format == "csv" else "ndjson"
+    filename = re.sub(r'[^\w.-]', '_', f"{patient_id}_history.{extension}")
+    return StreamingResponse(
+        generate(),
+        media_type="text/csv" if export_format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def require_simulation_mode():
     if not IS_SIMULATION:
         raise HTTPException(status_code=403, detail="Simulation mode is disabled")
-    
-    # Generate realistic simulation data
-    base_time = time.time()
-    data_points = []
-    
-    for i in range(request.duration_minutes):
-        timestamp = base_time + (i * 60)
-        # Simulate increasing blood loss with some randomness
-        volume_ml = min(request.max_volume, (i * request.max_volume / request.duration_minutes) + random.uniform(-10, 10))
-        rate_ml_min = random.uniform(0, 20)  # Simulate rate
-        
-        data = PatientData(
-            volume_ml=round(max(0, volume_ml), 2),
-            rate_ml_min=round(max(0, rate_ml_min), 2),
-            timestamp=timestamp,
-            patient_id=request.patient_id
+
+@app.post("/api/simulate")
+async def simulate_data(request: SimulatedDataRequest, simulation: SimulationEngine = Depends(get_simulation)):
+    """Start simulated devices in the background (replaces any running simulation)"""
+    require_simulation_mode()
+    if request.profile != "mixed" and request.profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile: {request.profile}")
+    # A ramp is defined by when it reaches max_volume, so it needs a run length
+    if request.profile == "ramp" and request.duration_minutes == 0:
+        raise HTTPException(status_code=400, detail="The ramp profile needs duration_minutes > 0")
+    profiles = list(PROFILES) if request.duration_minutes > 0 else [p for p in PROFILES if p != "ramp"]
+
+    if request.devices == 1:
+        patient_ids = [request.patient_id]
+    else:
+        patient_ids = [f"{request.patient_id}_{i:03d}" for i in range(1, request.devices + 1)]
+    devices = [
+        SimulatedDevice(
+            patient_id,
+            interval=request.interval_seconds,
+            jitter=request.jitter_seconds,
+            profile=random.choice(profiles) if request.profile == "mixed" else request.profile
         )
-        
-        # Store and broadcast
-        await receive_data(data)
-        data_points.append(data.dict())
-        
-        # Small delay to simulate real-time data
-        if i < request.duration_minutes - 1:
-            time.sleep(0.1)
-    
+        for patient_id in patient_ids
+    ]
+    await simulation.start(devices, request.duration_minutes, request.max_volume)
+
     return {
         "status": "success",
-        "message": f"Generated {len(data_points)} simulated data points",
-        "data_points": data_points
+        "message": f"Started {len(devices)} simulated devices",
+        "simulation": simulation.status()
     }
 
+@app.post("/api/simulate/stop")
+async def stop_simulation(simulation: SimulationEngine = Depends(get_simulation)):
+    require_simulation_mode()
+    await simulation.stop()
+    return {"status": "success", "message": "Simulation stopped", "simulation": simulation.status()}
+
+@app.get("/api/simulate")
+async def simulation_status(simulation: SimulationEngine = Depends(get_simulation)):
+    require_simulation_mode()
+    return simulation.status()
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",  # Use import string format
         host=BACKEND_HOST,
         port=BACKEND_PORT,
         reload=True,
-        log_level="info"
+        log_level="info",
+        # One synchronous stdout write per request; off unless asked for
+        access_log=ACCESS_LOG
     )
\ No newline at end of file
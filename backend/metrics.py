@@ -0,0 +1,245 @@
+# metrics.py
+"""In-process instrumentation exposed in Prometheus text format at /metrics.
+
+Instruments are plain Python objects: incrementing a counter or observing a
+histogram is an attribute update and a bisect, with no locks and no I/O, so
+they are safe to call on every reading. They are only ever updated from the
+event loop thread; values measured on worker threads are handed back and
+observed there. Metrics that mirror existing state (queue depths, socket
+counts, device frame totals) are callbacks evaluated at scrape time, so
+they cost nothing between scrapes.
+"""
+import asyncio
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; spans sub-millisecond commits up to multi-second stalls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], object]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # Returns a number, or for labelled metrics an iterable of (label values, number)
+        self.callback = callback
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values: str):
+        """The child for one label combination; keep a reference to it on hot paths"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._child()
+        return child
+
+    def _child(self):
+        return type(self)(self.name, self.help)
+
+    def _samples(self) -> List[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        """(suffix, label names, label values, value) for every sample"""
+        if self.callback is not None:
+            result = self.callback()
+            if not self.labelnames:
+                return [("", (), (), result)]
+            return [("", self.labelnames, tuple(str(v) for v in values), value) for values, value in result]
+        if not self.labelnames:
+            return self._own_samples()
+        samples = []
+        for key, child in self._children.items():
+            for suffix, names, values, value in child._own_samples():
+                samples.append((suffix, self.labelnames + names, key + values, value))
+        return samples
+
+    def _own_samples(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], object]] = None):
+        super().__init__(name, help, labelnames, callback)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def _own_samples(self):
+        return [("", (), (), self.value)]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], object]] = None):
+        super().__init__(name, help, labelnames, callback)
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def _own_samples(self):
+        return [("", (), (), self.value)]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _child(self):
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _own_samples(self):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            samples.append(("_bucket", ("le",), (_format_value(bound),), cumulative))
+        samples.append(("_sum", (), (), self.sum))
+        samples.append(("_count", (), (), self.count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = (),
+                callback: Optional[Callable[[], object]] = None) -> Counter:
+        return self.register(Counter(name, help, labelnames, callback))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = (),
+              callback: Optional[Callable[[], object]] = None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, callback))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A broken callback must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Instruments shared across modules
+READINGS_INGESTED = REGISTRY.counter(
+    "hemodrop_readings_ingested_total", "Readings accepted for storage and broadcast", ["source"])
+READINGS_STORED = REGISTRY.counter(
+    "hemodrop_readings_written_total", "Readings stored by the write-behind queue")
+READINGS_DUPLICATE = REGISTRY.counter(
+    "hemodrop_readings_duplicate_total", "Re-sent readings ignored because the same reading was already stored")
+WRITE_ERRORS = REGISTRY.counter(
+    "hemodrop_db_write_errors_total", "Write-behind batch attempts that failed, including ones retried")
+READINGS_DROPPED = REGISTRY.counter(
+    "hemodrop_readings_dropped_total", "Readings lost because their batch could not be written")
+DB_WRITE_SECONDS = REGISTRY.histogram(
+    "hemodrop_db_write_seconds", "Write-behind batch latency, including waiting for the writer thread")
+DB_COMMIT_SECONDS = REGISTRY.histogram(
+    "hemodrop_db_commit_seconds", "Time spent in COMMIT for a write-behind batch")
+DB_BATCH_SIZE = REGISTRY.histogram(
+    "hemodrop_db_batch_size", "Readings per write-behind batch", buckets=SIZE_BUCKETS)
+WS_MESSAGES_SENT = REGISTRY.counter(
+    "hemodrop_ws_messages_sent_total", "Messages written to dashboard WebSockets")
+WS_MESSAGES_DROPPED = REGISTRY.counter(
+    "hemodrop_ws_messages_dropped_total", "Messages dropped from a full WebSocket send queue")
+WS_MESSAGES_COALESCED = REGISTRY.counter(
+    "hemodrop_ws_messages_coalesced_total", "Pending messages replaced by a newer one for the same patient")
+WS_SEND_LAG_SECONDS = REGISTRY.histogram(
+    "hemodrop_ws_send_lag_seconds", "Time a message waited in a WebSocket send queue")
+ALERTS_RAISED = REGISTRY.counter(
+    "hemodrop_alerts_total", "Alerts raised by the hemorrhage engine", ["alert_type"])
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "hemodrop_event_loop_lag_seconds", "How late the event loop ran a timer")
+LOOP_LAG_LAST = REGISTRY.gauge(
+    "hemodrop_event_loop_lag_last_seconds", "Most recent event loop lag sample")
+LOG_SUPPRESSED = REGISTRY.counter(
+    "hemodrop_log_records_suppressed_total", "Log records dropped by the rate limiter")
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires; a busy event loop delays every coroutine"""
+
+    def __init__(self, interval_seconds: float = 0.5):
+        self.interval = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            LOOP_LAG_LAST.set(lag)
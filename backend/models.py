@@ -0,0 +1,673 @@
+# models.py
+"""SQLite storage layer for HemoDrop.
+
+All SQLite work runs on dedicated threads so the event loop never blocks on
+disk: a single writer thread owns the only write connection, and a pool of
+reader threads each keep their own long-lived connection. The database runs
+in WAL mode, so readers see a consistent snapshot while the writer commits.
+
+Readings are stored as a time series: `readings` is a WITHOUT ROWID table
+clustered on (patient_id, ts) with epoch-millisecond timestamps, so every
+range scan is a single index seek. Per-minute and per-hour rollups are kept
+up to date by a trigger on insert, and a retention task purges raw rows once
+they are older than the retention window.
+"""
+import asyncio
+import base64
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from downsample import lttb
+from metrics import (
+    DB_BATCH_SIZE, DB_COMMIT_SECONDS, DB_WRITE_SECONDS, READINGS_DROPPED, READINGS_DUPLICATE, READINGS_STORED,
+    WRITE_ERRORS,
+)
+
+log = logging.getLogger("hemodrop.db")
+
+# Schema version stored in PRAGMA user_version. Version 0 is the original
+# patient_data table with text timestamps; 3 adds the arrival-order index.
+SCHEMA_VERSION = 3
+
+# Statements are module constants so every long-lived connection reuses its
+# prepared statement from sqlite3's per-connection statement cache.
+CREATE_READINGS = '''
+    CREATE TABLE IF NOT EXISTS readings (
+        patient_id TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        received_ms INTEGER NOT NULL,
+        volume_ml REAL NOT NULL,
+        rate_ml_min REAL NOT NULL,
+        PRIMARY KEY (patient_id, ts)
+    ) WITHOUT ROWID
+'''
+
+# Arrival order for incremental pulls; late readings sort after any cursor
+# a client already holds
+CREATE_READINGS_RECEIVED_INDEX = '''
+    CREATE INDEX IF NOT EXISTS readings_received ON readings (patient_id, received_ms, ts)
+'''
+
+ROLLUP_TABLES = {60_000: "readings_1m", 3_600_000: "readings_1h"}
+
+CREATE_ROLLUP = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        patient_id TEXT NOT NULL,
+        bucket_ms INTEGER NOT NULL,
+        readings INTEGER NOT NULL,
+        volume_min REAL NOT NULL,
+        volume_max REAL NOT NULL,
+        volume_sum REAL NOT NULL,
+        rate_min REAL NOT NULL,
+        rate_max REAL NOT NULL,
+        rate_sum REAL NOT NULL,
+        last_ts INTEGER NOT NULL,
+        volume_last REAL NOT NULL,
+        rate_last REAL NOT NULL,
+        PRIMARY KEY (patient_id, bucket_ms)
+    ) WITHOUT ROWID
+'''
+
+# Runs once per row actually inserted (INSERT OR IGNORE skips duplicates)
+UPSERT_ROLLUP = '''
+    INSERT INTO {table} VALUES (
+        NEW.patient_id, NEW.ts - NEW.ts % {width}, 1,
+        NEW.volume_ml, NEW.volume_ml, NEW.volume_ml,
+        NEW.rate_ml_min, NEW.rate_ml_min, NEW.rate_ml_min,
+        NEW.ts, NEW.volume_ml, NEW.rate_ml_min
+    )
+    ON CONFLICT (patient_id, bucket_ms) DO UPDATE SET
+        readings = readings + 1,
+        volume_min = min(volume_min, excluded.volume_min),
+        volume_max = max(volume_max, excluded.volume_max),
+        volume_sum = volume_sum + excluded.volume_sum,
+        rate_min = min(rate_min, excluded.rate_min),
+        rate_max = max(rate_max, excluded.rate_max),
+        rate_sum = rate_sum + excluded.rate_sum,
+        volume_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.volume_last ELSE volume_last END,
+        rate_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.rate_last ELSE rate_last END,
+        last_ts = max(last_ts, excluded.last_ts);
+'''
+
+CREATE_ROLLUP_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS readings_rollup AFTER INSERT ON readings BEGIN\n"
+    + "".join(UPSERT_ROLLUP.format(table=table, width=width) for width, table in ROLLUP_TABLES.items())
+    + "END"
+)
+
+# Legacy rows only have second-resolution text timestamps and often share a
+# second, so rows within a second are spread over its milliseconds by id.
+MIGRATE_PATIENT_DATA = '''
+    INSERT OR IGNORE INTO readings (patient_id, ts, received_ms, volume_ml, rate_ml_min)
+    SELECT patient_id,
+           epoch_ms + ROW_NUMBER() OVER (PARTITION BY patient_id, epoch_ms ORDER BY id) - 1,
+           epoch_ms, volume_ml, rate_ml_min
+    FROM (
+        SELECT id, patient_id, COALESCE(volume_ml, 0) AS volume_ml, COALESCE(rate_ml_min, 0) AS rate_ml_min,
+               CAST(strftime('%s', timestamp) AS INTEGER) * 1000 AS epoch_ms
+        FROM patient_data
+        WHERE patient_id IS NOT NULL AND strftime('%s', timestamp) IS NOT NULL
+    )
+    ORDER BY patient_id, epoch_ms
+'''
+
+INSERT_READING = '''
+    INSERT OR IGNORE INTO readings (patient_id, ts, received_ms, volume_ml, rate_ml_min)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+SELECT_READING_AT = '''
+    SELECT received_ms, volume_ml, rate_ml_min FROM readings WHERE patient_id = ? AND ts = ?
+'''
+
+SELECT_HISTORY = '''
+    SELECT volume_ml, rate_ml_min, ts
+    FROM readings
+    WHERE patient_id = ? AND ts > ?
+    ORDER BY ts ASC
+'''
+
+SELECT_HISTORY_POINTS = '''
+    SELECT ts, volume_ml, rate_ml_min
+    FROM readings
+    WHERE patient_id = ? AND ts > ?
+    ORDER BY ts ASC
+'''
+
+# Keyset pagination in arrival order seeks readings_received instead of
+# counting past an OFFSET. Device timestamps would not do: a reading that
+# arrives late sorts behind cursors already handed out.
+SELECT_PAGE = '''
+    SELECT received_ms, ts, volume_ml, rate_ml_min
+    FROM readings
+    WHERE patient_id = ? AND (received_ms, ts) > (?, ?)
+    ORDER BY received_ms ASC, ts ASC
+    LIMIT ?
+'''
+
+# Patients with recent rollups, then an index seek per patient
+SELECT_RECENT_ALL = '''
+    SELECT r.patient_id, r.ts / 1000.0, r.volume_ml, r.rate_ml_min
+    FROM (SELECT DISTINCT patient_id FROM readings_1h WHERE bucket_ms >= :since_hour) AS p
+    JOIN readings AS r ON r.patient_id = p.patient_id AND r.ts > :since
+    ORDER BY r.patient_id, r.ts
+'''
+
+# One row per time bucket; "last" values come from the newest row in the
+# bucket. :since is aligned to :width, so every bucket is whole
+SELECT_RAW_BUCKETS = '''
+    SELECT b.bucket * :width, b.readings,
+           b.volume_min, b.volume_max, b.volume_mean, r.volume_ml,
+           b.rate_min, b.rate_max, b.rate_mean, r.rate_ml_min
+    FROM (
+        SELECT ts / :width AS bucket,
+               COUNT(*) AS readings,
+               MIN(volume_ml) AS volume_min, MAX(volume_ml) AS volume_max, AVG(volume_ml) AS volume_mean,
+               MIN(rate_ml_min) AS rate_min, MAX(rate_ml_min) AS rate_max, AVG(rate_ml_min) AS rate_mean,
+               MAX(ts) AS last_ts
+        FROM readings
+        WHERE patient_id = :patient_id AND ts >= :since
+        GROUP BY bucket
+    ) AS b
+    JOIN readings AS r ON r.patient_id = :patient_id AND r.ts = b.last_ts
+    ORDER BY b.bucket ASC
+'''
+
+# Same shape as SELECT_RAW_BUCKETS, merged from a rollup table whose bucket
+# width divides :width
+SELECT_ROLLUP_BUCKETS = '''
+    SELECT b.bucket * :width, b.readings,
+           b.volume_min, b.volume_max, b.volume_sum / b.readings, t.volume_last,
+           b.rate_min, b.rate_max, b.rate_sum / b.readings, t.rate_last
+    FROM (
+        SELECT bucket_ms / :width AS bucket,
+               SUM(readings) AS readings,
+               MIN(volume_min) AS volume_min, MAX(volume_max) AS volume_max, SUM(volume_sum) AS volume_sum,
+               MIN(rate_min) AS rate_min, MAX(rate_max) AS rate_max, SUM(rate_sum) AS rate_sum,
+               MAX(last_ts) AS last_ts
+        FROM {table}
+        WHERE patient_id = :patient_id AND bucket_ms >= :since
+        GROUP BY bucket
+    ) AS b
+    JOIN {table} AS t ON t.patient_id = :patient_id AND t.bucket_ms = b.last_ts - b.last_ts % {unit}
+    ORDER BY b.bucket ASC
+'''
+
+SELECT_BUCKETS = {
+    unit: SELECT_ROLLUP_BUCKETS.format(table=table, unit=unit) for unit, table in ROLLUP_TABLES.items()
+}
+
+SELECT_PATIENTS = '''
+    SELECT DISTINCT patient_id FROM readings_1h
+'''
+
+DELETE_RAW_BEFORE = '''
+    DELETE FROM readings WHERE patient_id = ? AND ts < ?
+'''
+
+DELETE_MINUTE_ROLLUPS_BEFORE = '''
+    DELETE FROM readings_1m WHERE patient_id = ? AND bucket_ms < ?
+'''
+
+
+class Database:
+    """Pooled SQLite connections with one writer thread and N reader threads"""
+
+    def __init__(self, path: str, readers: int = 4, cache_size_kb: int = 16384,
+                 mmap_size: int = 256 * 1024 * 1024):
+        self.path = path
+        self.readers = readers
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self._writer = None
+        self._reader_pool = None
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # Calls submitted to each pool and not yet finished
+        self.pending_writes = 0
+        self.pending_reads = 0
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        # Only takes effect on a new file; migrated files get it from VACUUM
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA journal_size_limit=67108864")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{self.cache_size_kb}")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA busy_timeout=5000")
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _connection(self, read_only: bool) -> sqlite3.Connection:
+        # Each pool thread lazily opens one connection and keeps it
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect(read_only)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, read_only: bool, fn: Callable, args: tuple) -> Any:
+        return fn(self._connection(read_only), *args)
+
+    async def open(self):
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="db-reader")
+        await self.write(_create_schema)
+
+    async def close(self):
+        for pool in (self._writer, self._reader_pool):
+            if pool is not None:
+                await asyncio.to_thread(pool.shutdown, True)
+        self._writer = None
+        self._reader_pool = None
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    async def write(self, fn: Callable, *args) -> Any:
+        """Run fn(conn, *args) on the writer thread"""
+        loop = asyncio.get_running_loop()
+        self.pending_writes += 1
+        try:
+            return await loop.run_in_executor(self._writer, self._call, False, fn, args)
+        finally:
+            self.pending_writes -= 1
+
+    async def read(self, fn: Callable, *args) -> Any:
+        """Run fn(conn, *args) on a reader thread"""
+        loop = asyncio.get_running_loop()
+        self.pending_reads += 1
+        try:
+            return await loop.run_in_executor(self._reader_pool, self._call, True, fn, args)
+        finally:
+            self.pending_reads -= 1
+
+    async def insert_readings(self, rows: List[tuple]) -> tuple:
+        """Insert (patient_id, ts_ms, received_ms, volume, rate) rows.
+
+        A row whose key is taken by the same reading (same ts and values) is
+        ignored; a different reading in the same millisecond moves to the
+        next free one. Returns (seconds spent committing, rows ignored).
+        """
+        return await self.write(_insert_readings, rows)
+
+    async def fetch_history(self, patient_id: str, since_ms: int) -> List[tuple]:
+        return await self.read(_fetch_history, patient_id, since_ms)
+
+    async def fetch_page(self, patient_id: str, after: Tuple[int, int], limit: int) -> List[tuple]:
+        """Up to `limit` (received_ms, ts, volume, rate) rows after the (received_ms, ts) position"""
+        return await self.read(_fetch_page, patient_id, after, limit)
+
+    async def fetch_recent(self, since: float) -> List[tuple]:
+        """(patient_id, epoch seconds, volume, rate) for every patient since an epoch time"""
+        return await self.read(_fetch_recent, since)
+
+    async def fetch_history_buckets(self, patient_id: str, since_ms: int, resolution: int) -> List[tuple]:
+        """Aggregates per `resolution` seconds, from the bucket that contains since_ms"""
+        return await self.read(_fetch_history_buckets, patient_id, since_ms, resolution)
+
+    async def fetch_history_lttb(self, patient_id: str, since_ms: int, max_points: int) -> List[tuple]:
+        return await self.read(_fetch_history_lttb, patient_id, since_ms, max_points)
+
+    async def patients(self) -> List[str]:
+        return await self.read(_patients)
+
+    async def purge_patient(self, patient_id: str, raw_before_ms: int, minute_before_ms: int) -> int:
+        return await self.write(_purge_patient, patient_id, raw_before_ms, minute_before_ms)
+
+    async def incremental_vacuum(self):
+        await self.write(_incremental_vacuum)
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def _create_schema(conn: sqlite3.Connection):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    migrated = False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(CREATE_READINGS)
+        conn.execute(CREATE_READINGS_RECEIVED_INDEX)
+        for table in ROLLUP_TABLES.values():
+            conn.execute(CREATE_ROLLUP.format(table=table))
+        conn.execute(CREATE_ROLLUP_TRIGGER)
+        if _table_exists(conn, "patient_data"):
+            count = conn.execute(MIGRATE_PATIENT_DATA).rowcount
+            conn.execute("DROP TABLE patient_data")
+            log.info("Migrated readings from patient_data", extra={"readings": count})
+            migrated = True
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if migrated:
+        # Rebuilds the file without the old table and enables incremental vacuum
+        conn.execute("VACUUM")
+
+
+def _insert_readings(conn: sqlite3.Connection, rows: List[tuple]) -> tuple:
+    duplicates = 0
+    try:
+        inserted = conn.executemany(INSERT_READING, rows).rowcount
+        if inserted < len(rows):
+            duplicates = _insert_collisions(conn, rows)
+    except Exception:
+        conn.rollback()
+        raise
+    start = time.perf_counter()
+    conn.commit()
+    return time.perf_counter() - start, duplicates
+
+
+def _insert_collisions(conn: sqlite3.Connection, rows: List[tuple]) -> int:
+    """Second pass over a batch that INSERT OR IGNORE skipped rows of.
+
+    Rows already stored with their own values (including received_ms) went in
+    during the first pass. A stored row with the same values but another
+    received_ms is a re-sent copy and is ignored. Any other collision is a
+    distinct reading, which is moved to the next free millisecond.
+    """
+    duplicates = 0
+    stored = set()
+    for patient_id, ts, received_ms, volume_ml, rate_ml_min in rows:
+        while True:
+            existing = conn.execute(SELECT_READING_AT, (patient_id, ts)).fetchone()
+            if existing is None:
+                conn.execute(INSERT_READING, (patient_id, ts, received_ms, volume_ml, rate_ml_min))
+                break
+            if existing[1] == volume_ml and existing[2] == rate_ml_min:
+                if existing[0] != received_ms or (patient_id, ts) in stored:
+                    duplicates += 1
+                stored.add((patient_id, ts))
+                break
+            ts += 1
+    return duplicates
+
+
+def _fetch_history(conn: sqlite3.Connection, patient_id: str, since_ms: int) -> List[tuple]:
+    return conn.execute(SELECT_HISTORY, (patient_id, since_ms)).fetchall()
+
+
+def _fetch_page(conn: sqlite3.Connection, patient_id: str, after: Tuple[int, int], limit: int) -> List[tuple]:
+    return conn.execute(SELECT_PAGE, (patient_id, after[0], after[1], limit)).fetchall()
+
+
+def _fetch_recent(conn: sqlite3.Connection, since: float) -> List[tuple]:
+    since_ms = int(since * 1000)
+    return conn.execute(SELECT_RECENT_ALL, {
+        "since": since_ms,
+        "since_hour": since_ms - since_ms % 3_600_000,
+    }).fetchall()
+
+
+def _fetch_history_buckets(conn: sqlite3.Connection, patient_id: str, since_ms: int,
+                           resolution: int) -> List[tuple]:
+    width = resolution * 1000
+    # Start on a bucket boundary so raw and rollup queries cover the same
+    # readings; otherwise a rollup's first bucket would include rows before
+    # since that the raw query leaves out
+    since_ms -= since_ms % width
+    # Use the coarsest rollup whose buckets tile the requested width
+    sql = SELECT_RAW_BUCKETS
+    for unit in sorted(SELECT_BUCKETS, reverse=True):
+        if width % unit == 0:
+            sql = SELECT_BUCKETS[unit]
+            break
+    return conn.execute(sql, {"patient_id": patient_id, "since": since_ms, "width": width}).fetchall()
+
+
+def _fetch_history_lttb(conn: sqlite3.Connection, patient_id: str, since_ms: int,
+                        max_points: int) -> List[tuple]:
+    # Runs on the reader thread so the selection never touches the event loop
+    rows = conn.execute(SELECT_HISTORY_POINTS, (patient_id, since_ms)).fetchall()
+    if len(rows) <= max_points:
+        return [(volume, rate, ts) for ts, volume, rate in rows]
+    xs = [row[0] for row in rows]
+    ys = [row[1] for row in rows]
+    return [(rows[i][1], rows[i][2], rows[i][0]) for i in lttb(xs, ys, max_points)]
+
+
+def _patients(conn: sqlite3.Connection) -> List[str]:
+    return [row[0] for row in conn.execute(SELECT_PATIENTS)]
+
+
+def _purge_patient(conn: sqlite3.Connection, patient_id: str, raw_before_ms: int,
+                   minute_before_ms: int) -> int:
+    with conn:
+        deleted = conn.execute(DELETE_RAW_BEFORE, (patient_id, raw_before_ms)).rowcount
+        conn.execute(DELETE_MINUTE_ROLLUPS_BEFORE, (patient_id, minute_before_ms))
+    return deleted
+
+
+def _incremental_vacuum(conn: sqlite3.Connection):
+    conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+
+def format_timestamp(epoch_ms: float) -> str:
+    """ISO 8601 UTC with millisecond precision, e.g. 2025-09-25T07:49:50.000Z"""
+    moment = datetime.fromtimestamp(epoch_ms / 1000, timezone.utc)
+    return moment.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def encode_cursor(position: Tuple[int, int]) -> str:
+    """Opaque resume token for the (received_ms, ts) keyset position of a reading"""
+    raw = json.dumps(list(position), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed tokens"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, list) or not 1 <= len(position) <= 2 or not all(
+            isinstance(v, int) and not isinstance(v, bool) for v in position):
+        raise ValueError("Invalid cursor")
+    if len(position) == 1:
+        # Cursors handed out before paging by arrival held only ts, which
+        # for on-time readings is close to when they were received
+        return position[0], position[0]
+    return position[0], position[1]
+
+
+class SeriesKeys:
+    """Millisecond keys for readings from devices without a clock.
+
+    Those readings are keyed by receive time, so two that arrive in the same
+    millisecond would collide; each one gets max(previous key + 1, receive
+    time) instead. Device timestamps are used as sent: readings that share
+    one are told apart (or recognized as re-sent copies) when they are stored.
+    """
+
+    def __init__(self, idle_seconds: float = 7200):
+        self.idle_seconds = idle_seconds
+        # patient_id -> last key handed out
+        self._last: Dict[str, int] = {}
+        self._last_sweep = 0.0
+
+    def key(self, patient_id: str, ts_ms: int, received_ms: int) -> int:
+        if ts_ms > 0:
+            return ts_ms
+        last = self._last.get(patient_id)
+        key = received_ms if last is None else max(last + 1, received_ms)
+        self._last[patient_id] = key
+
+        if received_ms - self._last_sweep > 60_000:
+            self._last_sweep = received_ms
+            horizon = received_ms - self.idle_seconds * 1000
+            self._last = {pid: last for pid, last in self._last.items() if last >= horizon}
+        return key
+
+
+class WriteBehindQueue:
+    """Buffers readings in memory and writes them with one transaction per batch.
+
+    A batch that fails with an operational error (locked or busy database,
+    full disk) is retried with exponential backoff; meanwhile new readings
+    wait in the queue, and producers block once it is full. Other errors,
+    and batches still failing after `retry_attempts`, are dropped.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db: Database, max_size: int, batch_size: int, flush_interval_ms: int,
+                 retry_attempts: int = 5, retry_backoff_ms: int = 100):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.retry_attempts = retry_attempts
+        self.retry_backoff = retry_backoff_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued"""
+        if self._task is None:
+            return
+        await self.queue.put(self._STOP)
+        await self._task
+        self._task = None
+
+    async def put(self, row: tuple):
+        # Waits only while the queue is full
+        await self.queue.put(row)
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self.queue.get()
+            if row is self._STOP:
+                break
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        row = await asyncio.wait_for(self.queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if row is self._STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[tuple]):
+        start = time.perf_counter()
+        attempt = 1
+        while True:
+            try:
+                commit_seconds, duplicates = await self.db.insert_readings(batch)
+                break
+            except Exception as e:
+                WRITE_ERRORS.inc()
+                if not isinstance(e, sqlite3.OperationalError) or attempt >= self.retry_attempts:
+                    READINGS_DROPPED.inc(len(batch))
+                    log.error("Dropped batch after write errors",
+                              extra={"readings": len(batch), "attempts": attempt, "error": str(e)})
+                    return
+                delay = self.retry_backoff * 2 ** (attempt - 1)
+                log.warning("Error writing batch, retrying",
+                            extra={"readings": len(batch), "attempt": attempt, "retry_in_seconds": delay,
+                                   "error": str(e)})
+                await asyncio.sleep(delay)
+                attempt += 1
+        DB_WRITE_SECONDS.observe(time.perf_counter() - start)
+        DB_COMMIT_SECONDS.observe(commit_seconds)
+        DB_BATCH_SIZE.observe(len(batch))
+        READINGS_STORED.inc(len(batch) - duplicates)
+        if duplicates:
+            READINGS_DUPLICATE.inc(duplicates)
+            log.info("Ignored re-sent readings", extra={"readings": duplicates})
+
+
+class RetentionTask:
+    """Periodically purges raw readings and minute rollups past their retention window.
+
+    Hourly rollups are kept, so long-range history survives the purge. Each
+    patient is purged in its own transaction so ingest batches interleave.
+    A retention of 0 days keeps that data forever. The first pass runs one
+    interval after startup, not during it.
+    """
+
+    def __init__(self, db: Database, interval_seconds: float, raw_days: float, minute_rollup_days: float):
+        self.db = db
+        self.interval = interval_seconds
+        self.raw_days = raw_days
+        self.minute_rollup_days = minute_rollup_days
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.raw_days > 0 or self.minute_rollup_days > 0
+
+    async def run_once(self) -> int:
+        now_ms = int(time.time() * 1000)
+        raw_before = now_ms - int(self.raw_days * 86_400_000) if self.raw_days > 0 else 0
+        minute_before = now_ms - int(self.minute_rollup_days * 86_400_000) if self.minute_rollup_days > 0 else 0
+        deleted = 0
+        for patient_id in await self.db.patients():
+            deleted += await self.db.purge_patient(patient_id, raw_before, minute_before)
+        if deleted:
+            await self.db.incremental_vacuum()
+        return deleted
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                deleted = await self.run_once()
+                if deleted:
+                    log.info("Retention purged raw readings", extra={"readings": deleted})
+            except Exception as e:
+                log.error("Error running retention", extra={"error": str(e)})
@@ -0,0 +1,100 @@
+# profiler.py
+"""Opt-in sampling profiler that can be switched on in a running server.
+
+While running, a daemon thread wakes every few milliseconds and records the
+current Python stack of every thread via `sys._current_frames()`. Nothing is
+traced or hooked, so the profiled code runs at full speed and the cost is
+bounded by the sampling rate. Stacks are reported in the "folded" format
+(`thread;outer;inner count`) that flamegraph.pl and speedscope read
+directly, plus a top list of the frames where samples landed.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    def __init__(self, max_depth: int = 64, max_stacks: int = 20000):
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.interval = 0.0
+        self.started = 0.0
+        self.stopped = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = 10, duration_seconds: float = 60):
+        """Clear previous samples and sample for at most duration_seconds"""
+        self.stop()
+        self.stacks = Counter()
+        self.samples = 0
+        self.interval = interval_ms / 1000
+        self.started = time.time()
+        self.stopped = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop, duration_seconds),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, stop: threading.Event, duration: float):
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while not stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                with self._lock:
+                    if key in self.stacks or len(self.stacks) < self.max_stacks:
+                        self.stacks[key] += 1
+            self.samples += 1
+        self.stopped = time.time()
+
+    def _snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.stacks)
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self._snapshot().most_common())
+
+    def report(self, limit: int = 25) -> dict:
+        # Samples per innermost frame: where the time was actually spent
+        leaves: Counter = Counter()
+        for stack, count in self._snapshot().items():
+            thread, _, frames = stack.partition(";")
+            leaves[(thread, frames.rsplit(";", 1)[-1])] += count
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "started": self.started or None,
+            "stopped": self.stopped or None,
+            "samples": self.samples,
+            "top": [
+                {"thread": thread, "frame": frame, "samples": count,
+                 "share": round(count / self.samples, 4) if self.samples else 0.0}
+                for (thread, frame), count in leaves.most_common(limit)
+            ],
+        }
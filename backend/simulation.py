@@ -0,0 +1,144 @@
+# simulation.py
+"""Virtual bedside devices for demos and load testing.
+
+Each device runs as its own asyncio task with its own sampling interval,
+timing jitter and bleeding profile, and feeds readings through the same
+ingest path as real devices. Nothing here blocks the event loop.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Length a ramp assumes when the run has no fixed length
+RAMP_DEFAULT_MINUTES = 10.0
+
+# Bleeding rate in mL/min as a function of elapsed minutes, run length in
+# minutes (0 if open-ended) and the volume cap
+PROFILES: Dict[str, Callable[[float, float, float], float]] = {
+    # Reaches max_volume at the end of the run (the old /api/simulate curve)
+    "ramp": lambda elapsed, duration, max_volume: max_volume / (duration if duration > 0 else RAMP_DEFAULT_MINUTES),
+    "normal": lambda elapsed, duration, max_volume: 1.5,
+    "minor": lambda elapsed, duration, max_volume: 5.0,
+    # Postpartum hemorrhage that keeps accelerating
+    "pph": lambda elapsed, duration, max_volume: min(60.0, 3.0 + 0.8 * elapsed),
+    "massive": lambda elapsed, duration, max_volume: 40.0,
+}
+
+log = logging.getLogger("hemodrop.simulation")
+
+IngestCallback = Callable[[str, float, float, float], Awaitable[None]]
+
+
+class SimulatedDevice:
+    """One virtual scale attached to one patient"""
+
+    __slots__ = ("patient_id", "interval", "jitter", "profile", "noise_ml",
+                 "volume", "rate", "readings", "started")
+
+    def __init__(self, patient_id: str, interval: float = 1.0, jitter: float = 0.1,
+                 profile: str = "ramp", noise_ml: float = 2.0):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile: {profile}")
+        self.patient_id = patient_id
+        self.interval = interval
+        self.jitter = jitter
+        self.profile = profile
+        self.noise_ml = noise_ml
+        self.volume = 0.0
+        self.rate = 0.0
+        self.readings = 0
+        self.started = 0.0
+
+    def step(self, now: float, dt: float, duration_minutes: float, max_volume: float):
+        """Advance the true blood loss by dt seconds and return a noisy (volume, rate) reading"""
+        elapsed = (now - self.started) / 60
+        base = PROFILES[self.profile](elapsed, duration_minutes, max_volume)
+        self.rate = max(0.0, base * random.uniform(0.7, 1.3))
+        self.volume = min(max_volume, self.volume + self.rate * dt / 60)
+        measured = max(0.0, self.volume + random.uniform(-self.noise_ml, self.noise_ml))
+        self.readings += 1
+        return round(measured, 2), round(self.rate, 2)
+
+    def as_dict(self) -> dict:
+        return {
+            "patient_id": self.patient_id,
+            "profile": self.profile,
+            "interval_seconds": self.interval,
+            "jitter_seconds": self.jitter,
+            "volume_ml": round(self.volume, 2),
+            "readings": self.readings,
+        }
+
+
+class SimulationEngine:
+    """Starts and stops a fleet of simulated devices as background tasks"""
+
+    def __init__(self, ingest: IngestCallback):
+        self.ingest = ingest
+        self.devices: List[SimulatedDevice] = []
+        self.duration_minutes = 0.0
+        self.max_volume = 0.0
+        self.errors = 0
+        self._tasks: List[asyncio.Task] = []
+        self._stop_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self, devices: List[SimulatedDevice], duration_minutes: float, max_volume: float):
+        await self.stop()
+        self.devices = devices
+        self.duration_minutes = duration_minutes
+        self.max_volume = max_volume
+        self.errors = 0
+        now = time.time()
+        for device in devices:
+            device.started = now
+            self._tasks.append(asyncio.create_task(self._run_device(device)))
+        if duration_minutes > 0:
+            self._stop_task = asyncio.create_task(self._stop_after(duration_minutes * 60))
+
+    async def stop(self):
+        if self._stop_task is not None and self._stop_task is not asyncio.current_task():
+            self._stop_task.cancel()
+        self._stop_task = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "duration_minutes": self.duration_minutes,
+            "devices": [device.as_dict() for device in self.devices],
+            "readings": sum(device.readings for device in self.devices),
+            "errors": self.errors,
+        }
+
+    async def _stop_after(self, seconds: float):
+        await asyncio.sleep(seconds)
+        await self.stop()
+
+    async def _run_device(self, device: SimulatedDevice):
+        loop = asyncio.get_running_loop()
+        # Random phase so devices don't all report on the same tick
+        await asyncio.sleep(random.uniform(0, device.interval))
+        next_tick = loop.time()
+        last = time.time()
+        while True:
+            now = time.time()
+            volume_ml, rate_ml_min = device.step(now, now - last, self.duration_minutes, self.max_volume)
+            last = now
+            try:
+                await self.ingest(device.patient_id, now, volume_ml, rate_ml_min)
+            except Exception as e:
+                self.errors += 1
+                log.warning("Simulated device failed to ingest",
+                            extra={"patient_id": device.patient_id, "error": str(e)})
+            next_tick += device.interval
+            delay = next_tick - loop.time() + random.uniform(-device.jitter, device.jitter)
+            await asyncio.sleep(max(0.0, delay))
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The device code (hardware/) imports its own config and sensors modules
+HARDWARE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "hardware")
+sys.path.append(HARDWARE_DIR)
+
+# main reads its configuration at import time; never touch the real database
+_tmpdir = tempfile.TemporaryDirectory(prefix="hemodrop-test-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir.name, "test.db")
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
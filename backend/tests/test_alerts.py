@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from alerts import HemorrhageEngine
+
+START_MS = 1_700_000_000_000
+
+
+def rapid_alerts(alerts):
+    return [a for a in alerts if a["message"].startswith("Rapid bleeding")]
+
+
+def feed(engine, rate_ml_min, noise_ml, seconds, seed):
+    """1 Hz readings of a steady bleed seen through a noisy scale"""
+    rng = random.Random(seed)
+    alerts = []
+    state = None
+    for i in range(seconds):
+        volume = max(0.0, rate_ml_min * i / 60 + rng.uniform(-noise_ml, noise_ml))
+        state, raised = engine.update("p1", START_MS + i * 1000, volume)
+        alerts.extend(raised)
+    return state, alerts
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_noisy_low_rate_raises_no_rapid_alert(seed):
+    state, alerts = feed(HemorrhageEngine(), rate_ml_min=1.5, noise_ml=2.0, seconds=600, seed=seed)
+    assert not rapid_alerts(alerts)
+    assert not state.rapid
+    assert state.window_rate == pytest.approx(1.5, abs=1.5)
+
+
+def test_noise_does_not_bias_smoothed_rate():
+    state, _ = feed(HemorrhageEngine(), rate_ml_min=0.0, noise_ml=2.0, seconds=600, seed=1)
+    assert state.smoothed_rate_ml_min < 5.0
+    assert state.as_dict("p1")["smoothed_rate_ml_min"] >= 0.0
+
+
+def test_steady_fast_bleed_raises_rapid_alert():
+    engine = HemorrhageEngine()
+    state, alerts = feed(engine, rate_ml_min=40.0, noise_ml=2.0, seconds=120, seed=1)
+    assert state.rapid
+    assert rapid_alerts(alerts)
+    assert state.window_rate == pytest.approx(40.0, rel=0.1)
+
+
+def test_rapid_flag_needs_half_a_window():
+    # Two readings 1 s apart would be 120 mL/min from end points alone
+    engine = HemorrhageEngine()
+    engine.update("p1", START_MS, 0.0)
+    engine.update("p1", START_MS + 1000, 2.0)
+    state, alerts = engine.update("p1", START_MS + 2000, 4.0)
+    assert not state.rapid
+    assert state.window_rate == 0.0
+
+
+def test_warm_restores_state_without_alerting_again():
+    before = HemorrhageEngine()
+    rows = [("p1", START_MS / 1000 + i, 10.0 * i, 0.0) for i in range(100)]
+    for patient_id, ts, volume, _ in rows:
+        before.update(patient_id, round(ts * 1000), volume)
+
+    after = HemorrhageEngine()
+    after.warm(rows)
+    assert after.state("p1").level_name == before.state("p1").level_name != "normal"
+    _, alerts = after.update("p1", START_MS + 100_000, 995.0)
+    assert not [a for a in alerts if not a["message"].startswith("Rapid bleeding")]
@@ -0,0 +1,52 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_profiler_is_hidden_by_default(client):
+    assert client.get("/debug/profiler").status_code == 404
+    assert client.post("/debug/profiler/start").status_code == 404
+    assert client.post("/debug/profiler/stop").status_code == 404
+    assert "profiler" not in client.get("/").json()["endpoints"]
+
+
+def test_profiler_can_be_enabled(client, monkeypatch):
+    monkeypatch.setattr(main, "PROFILER_ENABLED", True)
+    assert client.post("/debug/profiler/start", params={"duration_seconds": 0.05}).status_code == 200
+    assert client.post("/debug/profiler/stop").json()["running"] is False
+    assert client.get("/debug/profiler", params={"format": "folded"}).status_code == 200
+
+
+def test_history_rejects_empty_and_negative_windows(client):
+    for hours in (0, -5):
+        response = client.get("/api/history/p1", params={"hours": hours, "max_points": 10})
+        assert response.status_code == 422
+
+
+def test_history_returns_at_most_max_points_buckets(client):
+    now = time.time()
+    batch = [{"patient_id": "buckets", "volume_ml": float(i), "rate_ml_min": 1.0, "timestamp": now - i * 30}
+             for i in range(120)]
+    assert client.post("/api/data/batch", json=batch).status_code == 200
+    deadline = time.monotonic() + 5
+    while client.get("/api/readings/buckets").json()["data_points"] < 120 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    for max_points in (3, 7, 10, 59):
+        body = client.get("/api/history/buckets", params={"hours": 1, "max_points": max_points}).json()
+        assert 0 < body["data_points"] <= max_points
+        assert sum(bucket["readings"] for bucket in body["history"]) == 120
+
+
+def test_restart_restores_engine_state():
+    now = time.time()
+    batch = [{"patient_id": "restart", "volume_ml": 600.0 + i, "rate_ml_min": 1.0, "timestamp": now - 60 + i}
+             for i in range(30)]
+    with TestClient(main.app) as client:
+        assert client.post("/api/data/batch", json=batch).status_code == 200
+        # Stopping the app flushes the write-behind queue
+
+    main.engine.patients.clear()
+    with TestClient(main.app) as client:
+        assert client.get("/api/status/restart").json()["hemorrhage_level"] == "major"
@@ -0,0 +1,75 @@
+import time
+
+from cache import PatientRingBuffer, RecentReadingsCache
+
+
+def columns(window):
+    return [list(column) for column in window]
+
+
+def test_ring_returns_readings_after_since_in_order():
+    buffer = PatientRingBuffer(8, complete_since=0.0)
+    for ts in (10.0, 20.0, 30.0):
+        buffer.append(ts, ts / 10, 1.0)
+    assert columns(buffer.window(15.0)) == [[20.0, 30.0], [2.0, 3.0], [1.0, 1.0]]
+    assert columns(buffer.window(30.0)) == [[], [], []]
+
+
+def test_ring_wraparound_keeps_order_and_moves_completeness():
+    buffer = PatientRingBuffer(3, complete_since=0.0)
+    for ts in range(1, 6):
+        buffer.append(float(ts), float(ts), 0.0)
+    # 1 and 2 were overwritten, so only windows starting at 2 are complete
+    assert buffer.complete_since == 2.0
+    assert not buffer.covers(1.0)
+    assert buffer.covers(2.0)
+    assert columns(buffer.window(2.0))[0] == [3.0, 4.0, 5.0]
+
+
+def test_late_reading_falls_through_to_storage():
+    cache = RecentReadingsCache(capacity=8)
+    cache.warm([("p1", 10.0, 1.0, 0.0), ("p1", 30.0, 3.0, 0.0)], since=0.0)
+    cache.append("p1", 20.0, 2.0, 0.0)
+    # The cache does not hold 20, so it must not answer a window that includes it
+    assert cache.window("p1", 15.0) is None
+    assert cache.window("p1", 5.0) is None
+    assert columns(cache.window("p1", 20.0))[0] == [30.0]
+
+
+def test_unknown_patient_before_and_after_an_eviction():
+    cache = RecentReadingsCache(capacity=8, max_patients=1)
+    warm_since = time.time() - 3600
+    cache.warm([], since=warm_since)
+    # Nothing stored since warm-up, so the cache knows the patient has no readings
+    assert cache.window("nobody", warm_since) == ([], [], [])
+    assert cache.window("nobody", warm_since - 1) is None
+
+    cache.append("p1", time.time(), 1.0, 0.0)
+    cache.append("p2", time.time(), 1.0, 0.0)
+    # Evicting p1 forgets readings the cache once had, for any patient
+    assert cache.window("nobody", warm_since) is None
+    assert cache.window("p1", warm_since) is None
+    assert cache.window("nobody", time.time() + 1) == ([], [], [])
+
+
+def test_lru_evicts_least_recently_written_patient():
+    cache = RecentReadingsCache(capacity=8, max_patients=2)
+    cache.warm([], since=0.0)
+    now = time.time()
+    cache.append("p1", now, 1.0, 0.0)
+    cache.append("p2", now, 1.0, 0.0)
+    cache.append("p1", now + 1, 2.0, 0.0)
+    cache.append("p3", now + 1, 1.0, 0.0)
+    assert list(cache.buffers) == ["p1", "p3"]
+
+
+def test_idle_patients_are_evicted():
+    cache = RecentReadingsCache(capacity=8, idle_seconds=60)
+    cache.warm([], since=0.0)
+    now = time.time()
+    cache.append("p1", now, 1.0, 0.0)
+    cache.append("p2", now, 1.0, 0.0)
+    cache.buffers["p1"].last_seen -= 120
+    cache.evict_idle()
+    assert list(cache.buffers) == ["p2"]
+    assert cache.window("p1", 0.0) is None
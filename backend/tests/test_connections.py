@@ -0,0 +1,153 @@
+import asyncio
+import json
+
+from connections import COALESCE, DROP_OLDEST, ClientConnection, ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, fail: bool = False):
+        self.sent = []
+        self.accepted = False
+        self.fail = fail
+
+    async def accept(self):
+        self.accepted = True
+
+    async def send_text(self, text: str):
+        if self.fail:
+            raise ConnectionError("client went away")
+        self.sent.append(json.loads(text))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def drain():
+    """Let the writer tasks send everything queued"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def pending(client):
+    return [json.loads(box[0]) for _, box, _, _ in client._pending]
+
+
+def reading(n):
+    return json.dumps({"type": "real_time_data", "n": n})
+
+
+def alert(n):
+    return json.dumps({"type": "alert", "n": n})
+
+
+def test_overflow_evicts_readings_before_alerts():
+    client = ClientConnection(FakeWebSocket(), max_queue=3, policy=DROP_OLDEST)
+    client.enqueue(alert(1), critical=True)
+    client.enqueue(reading(1), "real_time_data:p1")
+    client.enqueue(reading(2), "real_time_data:p1")
+    client.enqueue(reading(3), "real_time_data:p1")
+    assert pending(client) == [{"type": "alert", "n": 1}, {"type": "real_time_data", "n": 2},
+                               {"type": "real_time_data", "n": 3}]
+    assert client.dropped == 1
+
+
+def test_alerts_are_never_evicted():
+    client = ClientConnection(FakeWebSocket(), max_queue=2, policy=DROP_OLDEST)
+    client.enqueue(reading(1), "real_time_data:p1")
+    for n in range(3):
+        client.enqueue(alert(n), critical=True)
+    assert [m["type"] for m in pending(client)] == ["alert", "alert", "alert"]
+    # Nothing else left to drop, so the queue grows rather than lose an alert
+    client.enqueue(alert(3), critical=True)
+    assert client.queue_depth() == 4
+
+
+def test_coalesce_replaces_pending_reading_in_place():
+    client = ClientConnection(FakeWebSocket(), max_queue=10, policy=COALESCE)
+    client.enqueue(reading(1), "real_time_data:p1")
+    client.enqueue(reading(2), "real_time_data:p2")
+    client.enqueue(reading(3), "real_time_data:p1")
+    assert pending(client) == [{"type": "real_time_data", "n": 3}, {"type": "real_time_data", "n": 2}]
+    assert client.dropped == 0
+
+
+def test_drop_oldest_keeps_every_reading_until_full():
+    client = ClientConnection(FakeWebSocket(), max_queue=2, policy=DROP_OLDEST)
+    for n in range(3):
+        client.enqueue(reading(n), "real_time_data:p1")
+    assert pending(client) == [{"type": "real_time_data", "n": 1}, {"type": "real_time_data", "n": 2}]
+    assert client.dropped == 1
+
+
+def test_broadcast_routes_to_subscribers_and_unsubscribed_clients():
+    async def scenario():
+        manager = ConnectionManager()
+        watching_p1, watching_p2, everything = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        clients = {ws: await manager.connect(ws) for ws in (watching_p1, watching_p2, everything)}
+        manager.subscribe(clients[watching_p1], "p1")
+        manager.subscribe(clients[watching_p2], "p2")
+        manager.broadcast({"type": "real_time_data", "patient_id": "p1"}, "p1")
+        manager.broadcast({"type": "notice"})
+        await drain()
+        for ws in list(manager.connections):
+            manager.disconnect(ws)
+        return watching_p1.sent, watching_p2.sent, everything.sent
+
+    p1, p2, everything = run(scenario())
+    assert [m["type"] for m in p1] == ["real_time_data", "notice"]
+    assert [m["type"] for m in p2] == ["notice"]
+    assert [m["type"] for m in everything] == ["real_time_data", "notice"]
+
+
+def test_unsubscribing_from_everything_receives_all_patients_again():
+    async def scenario():
+        manager = ConnectionManager()
+        ws = FakeWebSocket()
+        client = await manager.connect(ws)
+        manager.subscribe(client, "p1")
+        manager.broadcast({"type": "real_time_data", "patient_id": "p2"}, "p2")
+        manager.unsubscribe(client, "p1")
+        manager.broadcast({"type": "real_time_data", "patient_id": "p3"}, "p3")
+        await drain()
+        state = (client in manager.unsubscribed, dict(manager.subscribers))
+        manager.disconnect(ws)
+        return ws.sent, state
+
+    sent, (unsubscribed, subscribers) = run(scenario())
+    assert [m["patient_id"] for m in sent] == ["p3"]
+    assert unsubscribed and subscribers == {}
+
+
+def test_disconnect_cleans_up_subscriptions():
+    async def scenario():
+        manager = ConnectionManager()
+        ws = FakeWebSocket()
+        client = await manager.connect(ws)
+        manager.subscribe(client, "p1")
+        manager.subscribe(client, "p2")
+        manager.disconnect(ws)
+        await drain()
+        return manager, client
+
+    manager, client = run(scenario())
+    assert len(manager) == 0
+    assert manager.subscribers == {} and manager.unsubscribed == set()
+    assert client._task is None
+
+
+def test_failed_send_disconnects_the_client():
+    async def scenario():
+        manager = ConnectionManager()
+        broken, healthy = FakeWebSocket(fail=True), FakeWebSocket()
+        await manager.connect(broken)
+        await manager.connect(healthy)
+        manager.broadcast({"type": "real_time_data", "patient_id": "p1"}, "p1")
+        await drain()
+        remaining = [ws is healthy for ws in manager.connections]
+        manager.disconnect(healthy)
+        return remaining, healthy.sent
+
+    remaining, sent = run(scenario())
+    assert remaining == [True]
+    assert len(sent) == 1
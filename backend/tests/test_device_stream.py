@@ -0,0 +1,88 @@
+"""The bedside device's sender against the real /ws/device endpoint"""
+import asyncio
+import importlib.util
+import json
+import os
+import time
+
+import main
+from conftest import HARDWARE_DIR
+from sensors import FRAME, LocalDevice, RateTracker, decode_acks, encode_batch, encode_frame
+
+# hardware/main.py would shadow the backend's main module, so load it by path
+_spec = importlib.util.spec_from_file_location("device_main", os.path.join(HARDWARE_DIR, "main.py"))
+device = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(device)
+
+DEVICE_ID = 77
+PATIENT_ID = "stream_patient"
+
+
+def exchange(ws, sender, batch):
+    """Send one message and hand the backend's ack to the sender"""
+    ws.send_bytes(batch)
+    sender.acks_received += 1
+    acks = decode_acks(ws.receive_bytes())
+    for ack in acks:
+        sender.acked(ack)
+    return acks
+
+
+def stored_readings(client, expected, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        history = client.get(f"/api/history/{PATIENT_ID}", params={"hours": 1}).json()["history"]
+        if len(history) >= expected or time.monotonic() > deadline:
+            return history
+        time.sleep(0.05)
+
+
+def test_device_stream_round_trip(client):
+    sensor = LocalDevice(rate_ml_min=30, seed=1)
+    rates = RateTracker()
+    sender = device.BatchingSender(DEVICE_ID, max_frames=8, max_delay_ms=0, buffer_frames=100)
+    start = time.time() - 30
+    sent = []
+    for i in range(20):
+        now = start + i
+        volume = sensor.read_volume_ml() + i
+        sender.add(int(now * 1000), volume, rates.update(now, volume))
+        sent.append(volume)
+    duplicates = main.devices.duplicates
+
+    async def scenario():
+        with client.websocket_connect("/ws/device") as ws:
+            ws.send_text(json.dumps({"type": "bind", "device_id": DEVICE_ID, "patient_id": PATIENT_ID}))
+            assert json.loads(ws.receive_text())["type"] == "bound"
+            sender.reconnected()
+
+            # Seqs 1-8 arrive and are settled
+            [ack] = exchange(ws, sender, await sender.next_batch())
+            assert (ack.device_id, ack.contiguous, ack.highest, ack.gaps) == (DEVICE_ID, 8, 8, [])
+            assert list(sender.unacked) == list(range(9, 21))
+
+            # Seqs 9-16 are lost in transit; the next ack reports them as a gap
+            await sender.next_batch()
+            [ack] = exchange(ws, sender, await sender.next_batch())
+            assert (ack.contiguous, ack.highest, ack.gaps) == (8, 20, [(9, 16)])
+            assert list(sender.unacked) == list(range(9, 17))
+            assert list(sender.outgoing) == list(range(9, 17))
+
+            # Only the gap is re-sent, and that closes it
+            batch = await sender.next_batch()
+            assert len(batch) == 8 * FRAME.size
+            [ack] = exchange(ws, sender, batch)
+            assert (ack.contiguous, ack.highest, ack.gaps) == (20, 20, [])
+            assert not sender.unacked and not sender.outgoing
+
+            # A stale copy of settled frames is acked but not ingested again
+            replay = encode_batch(encode_frame(DEVICE_ID, seq, int((start + seq) * 1000), 1.0, 1.0)
+                                  for seq in (3, 4, 5))
+            [ack] = exchange(ws, sender, replay)
+            assert (ack.contiguous, ack.highest, ack.gaps) == (20, 20, [])
+
+    asyncio.run(scenario())
+    assert main.devices.duplicates - duplicates == 3
+    history = stored_readings(client, 20)
+    assert len(history) == 20
+    assert [reading["volume_ml"] for reading in history] == [round(v, 2) for v in sent]
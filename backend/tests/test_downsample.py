@@ -0,0 +1,76 @@
+import math
+import time
+from array import array
+
+import pytest
+
+from downsample import lttb
+
+
+def triangle_area(a, b, c):
+    return abs((a[0] - c[0]) * (b[1] - a[1]) - (a[0] - b[0]) * (c[1] - a[1])) / 2
+
+
+def test_short_series_and_small_thresholds_are_kept_whole():
+    xs = list(range(10))
+    assert lttb(xs, xs, 10) == xs
+    assert lttb(xs, xs, 50) == xs
+    assert lttb(xs, xs, 2) == xs
+    assert lttb([], [], 5) == []
+
+
+@pytest.mark.parametrize("threshold", [3, 10, 100, 999])
+def test_selects_threshold_points_in_order_keeping_the_ends(threshold):
+    xs = list(range(1000))
+    ys = [math.sin(x / 50) for x in xs]
+    indices = lttb(xs, ys, threshold)
+    assert len(indices) == threshold
+    assert indices[0] == 0 and indices[-1] == 999
+    assert indices == sorted(set(indices))
+
+
+def test_each_point_is_the_largest_triangle_in_its_bucket():
+    xs = [float(x) for x in range(200)]
+    ys = [math.sin(x / 7) * x for x in xs]
+    threshold = 12
+    indices = lttb(xs, ys, threshold)
+    every = (len(xs) - 2) / (threshold - 2)
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        assert start <= indices[i + 1] < end
+        next_start, next_end = end, min(int((i + 2) * every) + 1, len(xs))
+        average = (sum(xs[next_start:next_end]) / (next_end - next_start),
+                   sum(ys[next_start:next_end]) / (next_end - next_start))
+        previous = (xs[indices[i]], ys[indices[i]])
+        areas = [triangle_area(previous, (xs[j], ys[j]), average) for j in range(start, end)]
+        assert triangle_area(previous, (xs[indices[i + 1]], ys[indices[i + 1]]), average) == pytest.approx(max(areas))
+
+
+def test_keeps_a_spike():
+    xs = list(range(500))
+    ys = [0.0] * 500
+    ys[250] = 100.0
+    assert 250 in lttb(xs, ys, 20)
+
+
+def test_accepts_cache_columns():
+    xs = array('d', range(100))
+    ys = array('d', (x * x for x in range(100)))
+    assert lttb(xs, ys, 10) == lttb(list(xs), list(ys), 10)
+
+
+def test_history_lttb_endpoint(client):
+    now = time.time()
+    batch = [{"patient_id": "lttb", "volume_ml": float(i % 17), "rate_ml_min": 1.0, "timestamp": now - 300 + i}
+             for i in range(300)]
+    assert client.post("/api/data/batch", json=batch).status_code == 200
+    assert client.get("/api/history/lttb", params={"method": "lttb"}).status_code == 400
+
+    deadline = time.monotonic() + 5
+    while client.get("/api/readings/lttb").json()["data_points"] < 300 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    body = client.get("/api/history/lttb", params={"hours": 1, "method": "lttb", "max_points": 40}).json()
+    assert body["method"] == "lttb"
+    assert body["data_points"] == 40
+    timestamps = [point["timestamp"] for point in body["history"]]
+    assert timestamps == sorted(timestamps)
@@ -0,0 +1,114 @@
+import pytest
+
+from hardware import ACK_GAP, ACK_HEADER, FRAME, DeviceRegistry, SequenceTracker, decode_frames
+
+
+def unpack_ack(payload):
+    device_id, contiguous, highest, count = ACK_HEADER.unpack_from(payload)
+    gaps = [ACK_GAP.unpack_from(payload, ACK_HEADER.size + i * ACK_GAP.size) for i in range(count)]
+    return device_id, contiguous, highest, gaps
+
+
+def test_tracker_in_order():
+    tracker = SequenceTracker(1, window=100)
+    assert all(tracker.add(seq) for seq in range(1, 6))
+    assert (tracker.contiguous, tracker.highest, tracker.received) == (5, 5, set())
+    assert tracker.gaps(10) == ([], 5)
+
+
+def test_tracker_rejects_duplicates():
+    tracker = SequenceTracker(1, window=100)
+    for seq in (1, 2, 5):
+        tracker.add(seq)
+    assert not tracker.add(2)
+    assert not tracker.add(5)
+    assert tracker.add(3)
+
+
+def test_tracker_closes_gaps_out_of_order():
+    tracker = SequenceTracker(1, window=100)
+    for seq in (1, 4, 7, 8):
+        tracker.add(seq)
+    assert tracker.gaps(10) == ([(2, 3), (5, 6)], 8)
+    for seq in (3, 2, 6):
+        tracker.add(seq)
+    assert tracker.contiguous == 4
+    assert tracker.gaps(10) == ([(5, 5)], 8)
+    tracker.add(5)
+    assert (tracker.contiguous, tracker.received) == (8, set())
+
+
+def test_tracker_gives_up_on_gaps_older_than_window():
+    tracker = SequenceTracker(1, window=10)
+    tracker.add(1)
+    tracker.add(5)
+    tracker.add(20)
+    # 2-4 and 6-10 fell out of the window; 5 had arrived
+    assert tracker.lost == 8
+    assert tracker.contiguous == 10
+    assert tracker.gaps(10) == ([(11, 19)], 20)
+    assert not tracker.add(3)
+
+
+def test_tracker_starts_at_first_seq_seen():
+    tracker = SequenceTracker(500, window=100)
+    assert tracker.add(500)
+    assert tracker.contiguous == 500
+
+
+def test_decode_frames_rejects_partial_and_oversized_messages():
+    frame = FRAME.pack(1, 1, 1_700_000_000_000, 1.5, 0.5)
+    assert list(decode_frames(frame * 2, 2)) == [(1, 1, 1_700_000_000_000, 1.5, 0.5)] * 2
+    with pytest.raises(ValueError):
+        decode_frames(frame[:-1], 2)
+    with pytest.raises(ValueError):
+        decode_frames(frame * 3, 2)
+
+
+def test_registry_counts_duplicates_and_files_unbound_devices():
+    devices = DeviceRegistry()
+    assert devices.accept(3, 1)
+    assert not devices.accept(3, 1)
+    assert not devices.accept(3, 0)
+    assert devices.duplicates == 2
+    assert devices.patient_id(3) == "device_3"
+    devices.bind(3, "p1")
+    assert devices.patient_id(3) == "p1"
+
+
+def test_truncated_ack_does_not_cover_gaps_left_out():
+    devices = DeviceRegistry(max_ack_gaps=2)
+    for seq in (1, 3, 5, 7, 9):
+        devices.accept(1, seq)
+    # 6 and 8 are still missing but did not fit, so the ack must stop before them
+    assert unpack_ack(devices.ack([1])) == (1, 1, 5, [(2, 2), (4, 4)])
+
+
+def test_complete_ack_covers_highest_seq():
+    devices = DeviceRegistry(max_ack_gaps=2)
+    for seq in (1, 3, 5):
+        devices.accept(1, seq)
+    assert unpack_ack(devices.ack([1])) == (1, 1, 5, [(2, 2), (4, 4)])
+
+
+def test_registry_forgets_idle_devices():
+    devices = DeviceRegistry(idle_seconds=60)
+    devices.bind(1, "p1")
+    devices.accept(1, 1)
+    devices.accept(2, 1)
+    devices.last_seen[1] -= 120
+    devices.evict_idle()
+    assert list(devices.trackers) == [2]
+    assert devices.patient_id(1) == "device_1"
+
+
+def test_registry_is_bounded_and_keeps_lost_counts():
+    devices = DeviceRegistry(window=10, max_devices=3)
+    devices.accept(1, 1)
+    devices.accept(1, 20)
+    assert devices.lost() == 9
+    for device_id in range(2, 6):
+        devices.accept(device_id, 1)
+    assert len(devices) == 3 and len(devices.last_seen) == 3
+    assert 1 not in devices.trackers
+    assert devices.lost() == 9
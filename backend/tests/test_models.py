@@ -0,0 +1,159 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from metrics import READINGS_DROPPED, WRITE_ERRORS
+from models import Database, RetentionTask, WriteBehindQueue
+
+DAY_MS = 86_400_000
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def open_db(tmp_path) -> Database:
+    db = Database(str(tmp_path / "test.db"), readers=1)
+    await db.open()
+    return db
+
+
+def test_retention_keeps_everything_by_default(tmp_path):
+    async def scenario():
+        db = await open_db(tmp_path)
+        try:
+            now_ms = int(time.time() * 1000)
+            old = now_ms - 400 * DAY_MS
+            await db.insert_readings([("p1", old, old, 10.0, 1.0), ("p1", now_ms, now_ms, 20.0, 1.0)])
+            retention = RetentionTask(db, 3600, raw_days=0, minute_rollup_days=0)
+            assert not retention.enabled
+            assert await retention.run_once() == 0
+            return await db.fetch_history("p1", 0)
+        finally:
+            await db.close()
+
+    assert len(run(scenario())) == 2
+
+
+def test_retention_purges_only_when_configured(tmp_path):
+    async def scenario():
+        db = await open_db(tmp_path)
+        try:
+            now_ms = int(time.time() * 1000)
+            old = now_ms - 40 * DAY_MS
+            await db.insert_readings([("p1", old, old, 10.0, 1.0), ("p1", now_ms, now_ms, 20.0, 1.0)])
+            retention = RetentionTask(db, 3600, raw_days=30, minute_rollup_days=0)
+            assert await retention.run_once() == 1
+            return await db.fetch_history("p1", 0)
+        finally:
+            await db.close()
+
+    assert len(run(scenario())) == 1
+
+
+def test_retention_does_not_purge_at_startup(tmp_path):
+    async def scenario():
+        db = await open_db(tmp_path)
+        try:
+            old = int(time.time() * 1000) - 40 * DAY_MS
+            await db.insert_readings([("p1", old, old, 10.0, 1.0)])
+            retention = RetentionTask(db, 3600, raw_days=30, minute_rollup_days=30)
+            await retention.start()
+            await asyncio.sleep(0.1)
+            await retention.stop()
+            return await db.fetch_history("p1", 0)
+        finally:
+            await db.close()
+
+    assert len(run(scenario())) == 1
+
+
+class FlakyDatabase:
+    """Fails the first `failures` inserts with `error`, then writes through"""
+
+    def __init__(self, db: Database, failures: int, error: Exception):
+        self.db = db
+        self.failures = failures
+        self.error = error
+        self.attempts = 0
+
+    async def insert_readings(self, rows):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise self.error
+        return await self.db.insert_readings(rows)
+
+
+def write_through_queue(tmp_path, failures, error, attempts=3):
+    async def scenario():
+        db = await open_db(tmp_path)
+        try:
+            flaky = FlakyDatabase(db, failures, error)
+            queue = WriteBehindQueue(flaky, 100, 10, 10, retry_attempts=attempts, retry_backoff_ms=1)
+            await queue.start()
+            now_ms = int(time.time() * 1000)
+            for i in range(5):
+                await queue.put(("p1", now_ms + i, now_ms + i, float(i), 1.0))
+            await queue.stop()
+            return flaky.attempts, await db.fetch_history("p1", 0)
+        finally:
+            await db.close()
+
+    return run(scenario())
+
+
+def test_write_behind_retries_transient_errors(tmp_path):
+    errors, dropped = WRITE_ERRORS.value, READINGS_DROPPED.value
+    attempts, rows = write_through_queue(tmp_path, 2, sqlite3.OperationalError("database is locked"))
+    assert attempts == 3
+    assert len(rows) == 5
+    assert WRITE_ERRORS.value - errors == 2
+    assert READINGS_DROPPED.value == dropped
+
+
+def test_write_behind_drops_batch_after_last_attempt(tmp_path):
+    errors, dropped = WRITE_ERRORS.value, READINGS_DROPPED.value
+    attempts, rows = write_through_queue(tmp_path, 10, sqlite3.OperationalError("disk I/O error"))
+    assert attempts == 3
+    assert rows == []
+    assert WRITE_ERRORS.value - errors == 3
+    assert READINGS_DROPPED.value - dropped == 5
+
+
+def test_write_behind_does_not_retry_other_errors(tmp_path):
+    dropped = READINGS_DROPPED.value
+    attempts, rows = write_through_queue(tmp_path, 1, sqlite3.IntegrityError("bad row"))
+    assert attempts == 1
+    assert rows == []
+    assert READINGS_DROPPED.value - dropped == 5
+
+
+@pytest.mark.parametrize("resolution", [3600, 120, 90])
+def test_history_buckets_cover_whole_buckets_from_any_table(tmp_path, resolution):
+    # 3600 s reads the hourly rollup, 120 s the minute rollup, 90 s raw rows
+    start = 1_700_000_000_000
+    rows = [("p1", start + i * 7_000, start, float(i), 1.0) for i in range(2000)]
+    since = start + 3_333_333
+
+    async def scenario():
+        db = await open_db(tmp_path)
+        try:
+            await db.insert_readings(rows)
+            return await db.fetch_history_buckets("p1", since, resolution)
+        finally:
+            await db.close()
+
+    width = resolution * 1000
+    first = since - since % width
+    expected = {}
+    for _, ts, _, volume, _ in rows:
+        if ts >= first:
+            expected.setdefault(ts - ts % width, []).append(volume)
+    buckets = run(scenario())
+    assert [b[0] for b in buckets] == sorted(expected)
+    for bucket_ms, readings, volume_min, volume_max, volume_mean, volume_last, *_ in buckets:
+        volumes = expected[bucket_ms]
+        assert (readings, volume_min, volume_max, volume_last) == (len(volumes), min(volumes), max(volumes), volumes[-1])
+        assert volume_mean == pytest.approx(sum(volumes) / len(volumes))
@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+import time
+
+import pytest
+
+import main
+
+
+def post(client, patient_id, volume_ml, timestamp):
+    response = client.post("/api/data", json={
+        "patient_id": patient_id, "volume_ml": volume_ml, "rate_ml_min": 1.0, "timestamp": timestamp})
+    assert response.status_code == 200
+
+
+def page(client, patient_id, expected, timeout=5.0, **params):
+    """Poll until the write-behind queue has stored `expected` readings"""
+    deadline = time.monotonic() + timeout
+    while True:
+        body = client.get(f"/api/readings/{patient_id}", params=params).json()
+        if body["data_points"] >= expected or time.monotonic() > deadline:
+            return body
+        time.sleep(0.05)
+
+
+def test_cursor_returns_late_readings(client):
+    now = time.time()
+    post(client, "late", 1.0, now)
+    cursor = page(client, "late", 1)["next_cursor"]
+    # Replayed from a device buffer: stored after the cursor, timestamped before it
+    post(client, "late", 2.0, now - 30)
+    body = page(client, "late", 1, cursor=cursor)
+    assert [r["volume_ml"] for r in body["readings"]] == [2.0]
+    assert page(client, "late", 0, cursor=body["next_cursor"])["data_points"] == 0
+
+
+@pytest.mark.parametrize("cursor", ["bad", "W10", "WyJ4Il0"])
+def test_malformed_cursor_is_rejected(client, cursor):
+    assert client.get("/api/readings/p1", params={"cursor": cursor}).status_code == 400
+
+
+def store(client, patient_id, count):
+    """Post `count` readings one second apart and wait until they are stored"""
+    now = time.time()
+    batch = [{"patient_id": patient_id, "volume_ml": float(i), "rate_ml_min": 1.0, "timestamp": now - count + i}
+             for i in range(count)]
+    assert client.post("/api/data/batch", json=batch).status_code == 200
+    assert page(client, patient_id, count, limit=10000)["data_points"] == count
+
+
+def test_cursor_round_trip_pages_through_everything_once(client):
+    store(client, "paged", 25)
+    volumes, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 10} if cursor is None else {"limit": 10, "cursor": cursor}
+        body = client.get("/api/readings/paged", params=params).json()
+        volumes += [r["volume_ml"] for r in body["readings"]]
+        cursor = body["next_cursor"]
+        pages += 1
+        if not body["has_more"]:
+            break
+    assert volumes == [float(i) for i in range(25)]
+    assert pages == 3
+    # The last cursor stays valid and only returns what arrives later
+    assert client.get("/api/readings/paged", params={"cursor": cursor}).json()["data_points"] == 0
+
+
+def test_has_more_on_an_exact_page_boundary(client):
+    store(client, "boundary", 10)
+    first = client.get("/api/readings/boundary", params={"limit": 10}).json()
+    assert first["has_more"] is True
+    rest = client.get("/api/readings/boundary", params={"limit": 10, "cursor": first["next_cursor"]}).json()
+    assert (rest["data_points"], rest["has_more"]) == (0, False)
+    # An empty page hands back the cursor it was given
+    assert rest["next_cursor"] == first["next_cursor"]
+
+
+def test_export_ndjson_matches_readings(client):
+    store(client, "ndjson", 7)
+    response = client.get("/api/export/ndjson")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert 'filename="ndjson_history.ndjson"' in response.headers["content-disposition"]
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert exported == client.get("/api/readings/ndjson").json()["readings"]
+
+
+def test_export_csv(client):
+    store(client, "csv", 3)
+    response = client.get("/api/export/csv", params={"format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["cursor", "patient_id", "ts", "timestamp", "volume_ml", "rate_ml_min"]
+    assert [row[4] for row in rows[1:]] == ["0.0", "1.0", "2.0"]
+
+
+@pytest.mark.parametrize("count", [10, 11, 9])
+def test_export_chunks_on_and_around_page_boundaries(client, monkeypatch, count):
+    monkeypatch.setattr(main, "EXPORT_CHUNK_SIZE", 5)
+    patient_id = f"chunks{count}"
+    store(client, patient_id, count)
+    exported = [json.loads(line)["volume_ml"] for line in client.get(f"/api/export/{patient_id}").text.splitlines()]
+    assert exported == [float(i) for i in range(count)]
+
+
+def test_export_resumes_from_a_cursor(client):
+    store(client, "resume", 6)
+    cursor = client.get("/api/readings/resume", params={"limit": 4}).json()["next_cursor"]
+    exported = client.get("/api/export/resume", params={"cursor": cursor}).text.splitlines()
+    assert [json.loads(line)["volume_ml"] for line in exported] == [4.0, 5.0]
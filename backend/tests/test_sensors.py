@@ -0,0 +1,64 @@
+"""The bedside device's stand-in sensor and rate tracker (hardware/sensors.py)"""
+import pytest
+
+import sensors
+from sensors import LocalDevice, RateTracker
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(sensors, "time", fake)
+    return fake
+
+
+def run_device(clock, rate_ml_min, seconds, seed=1):
+    device = LocalDevice(rate_ml_min=rate_ml_min, noise_ml=2.0, seed=seed)
+    rates = RateTracker()
+    volumes, rate = [], 0.0
+    for _ in range(seconds):
+        clock.now += 1
+        volume = device.read_volume_ml()
+        rate = rates.update(clock.now, volume)
+        volumes.append(volume)
+    return device, volumes, rate
+
+
+def test_reported_rate_tracks_true_rate(clock):
+    # Clamping each noisy sample used to report ~180 mL/min for a 5 mL/min bleed
+    reported = []
+    for seed in range(20):
+        device, _, rate = run_device(clock, rate_ml_min=5.0, seconds=600, seed=seed)
+        assert rate == pytest.approx(5.0, abs=5.0)
+        assert device.volume == pytest.approx(50.0, rel=0.1)
+        reported.append(rate)
+    assert sum(reported) / len(reported) == pytest.approx(5.0, abs=1.0)
+
+
+def test_true_volume_only_grows(clock):
+    device = LocalDevice(rate_ml_min=5.0, noise_ml=0.0, seed=1)
+    readings = []
+    for _ in range(120):
+        clock.now += 1
+        readings.append(device.read_volume_ml())
+    assert readings == sorted(readings)
+
+
+def test_noise_alone_reports_no_bleeding(clock):
+    _, volumes, rate = run_device(clock, rate_ml_min=0.0, seconds=600)
+    assert rate < 3.0
+    assert min(volumes) >= 0.0
+
+
+def test_rate_is_reported_non_negative():
+    rates = RateTracker(tau_seconds=30)
+    rates.update(0.0, 10.0)
+    assert rates.update(1.0, 5.0) == 0.0
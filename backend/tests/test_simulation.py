@@ -0,0 +1,15 @@
+import math
+
+from simulation import PROFILES, SimulatedDevice
+
+
+def test_profiles_are_finite_for_open_ended_runs():
+    for name, profile in PROFILES.items():
+        rate = profile(5.0, 0.0, 500.0)
+        assert math.isfinite(rate) and rate < 500, name
+
+
+def test_open_ended_ramp_does_not_jump_to_max_volume():
+    device = SimulatedDevice("p1", profile="ramp", noise_ml=0.0)
+    volume, _ = device.step(1.0, 1.0, 0.0, 500.0)
+    assert volume < 10
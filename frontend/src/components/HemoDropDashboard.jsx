@@ -110,6 +110,8 @@ const HemoDropDashboard = () => {
             console.log(`Connected to backend in ${message.mode} mode`);
           } else if (message.type === 'real_time_data') {
             handleBackendData(message.data);
+          } else if (message.type === 'snapshot') {
+            handleBackendSnapshot(message);
           }
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);
@@ -140,6 +142,21 @@ const HemoDropDashboard = () => {
     }
   }, [isUsingBackend]);
 
+  // Only receive real-time data for the selected patient
+  useEffect(() => {
+    const ws = wsRef.current;
+    if (!backendConnected || ws?.readyState !== WebSocket.OPEN) return;
+
+    const patientId = selectedPatient.id.toString();
+    ws.send(JSON.stringify({ type: 'subscribe_patient', patient_id: patientId }));
+
+    return () => {
+      if (ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ type: 'unsubscribe_patient', patient_id: patientId }));
+      }
+    };
+  }, [backendConnected, selectedPatient.id]);
+
   // Handle data from backend
   const handleBackendData = useCallback((data) => {
     if (data.patient_id !== selectedPatient.id.toString()) {
@@ -163,6 +180,25 @@ const HemoDropDashboard = () => {
     });
   }, [selectedPatient.id, zoomLevel]);
 
+  // Recent readings sent by the backend when we subscribe to a patient
+  const handleBackendSnapshot = useCallback((snapshot) => {
+    if (snapshot.patient_id !== selectedPatient.id.toString()) {
+      return;
+    }
+
+    const cutoff = Date.now() - zoomLevel * 60 * 1000;
+    const points = snapshot.data
+      .map(data => ({
+        timestamp: new Date(data.timestamp).getTime(),
+        time: new Date(data.timestamp).toLocaleTimeString('en-US', { hour: '2-digit', minute: '2-digit', hour12: false }),
+        bloodLoss: data.volume_ml,
+        rate: data.rate_ml_min,
+      }))
+      .filter(d => d.timestamp >= cutoff);
+
+    setMonitoringData(calculateRates(points));
+  }, [selectedPatient.id, zoomLevel]);
+
   // Backend API calls
   const sendDataToBackend = useCallback(async (data) => {
     if (!isUsingBackend || !backendConnected) return;
@@ -185,11 +221,14 @@ const HemoDropDashboard = () => {
     }
   }, [isUsingBackend, backendConnected, selectedPatient.id]);
 
-  const fetchPatientHistory = useCallback(async (patientId, hours = 24) => {
+  // The backend downsamples to roughly one point per chart pixel column
+  const fetchPatientHistory = useCallback(async (patientId, hours = 24, maxPoints = 600) => {
     if (!isUsingBackend || !backendConnected) return [];
 
     try {
-      const response = await fetch(`${API_BASE_URL}/api/history/${patientId}?hours=${hours}`);
+      const response = await fetch(
+        `${API_BASE_URL}/api/history/${patientId}?hours=${hours}&max_points=${maxPoints}&method=lttb`
+      );
       if (response.ok) {
         const data = await response.json();
         return data.history.map(item => ({
@@ -401,6 +440,14 @@ const HemoDropDashboard = () => {
   }, [paused, clearMonitoringInterval]);
 
   const downloadPatientHistory = useCallback(() => {
+    // The backend streams the full stored history; no need to build it here
+    if (isUsingBackend && backendConnected) {
+      const linkElement = document.createElement('a');
+      linkElement.setAttribute('href', `${API_BASE_URL}/api/export/${selectedPatient.id}?format=csv`);
+      linkElement.click();
+      return;
+    }
+
     if (monitoringData.length === 0) return;
     
     const dataStr = JSON.stringify(monitoringData, null, 2);
@@ -411,7 +458,7 @@ const HemoDropDashboard = () => {
     linkElement.setAttribute('href', dataUri);
     linkElement.setAttribute('download', exportFileDefaultName);
     linkElement.click();
-  }, [monitoringData, selectedPatient.name]);
+  }, [isUsingBackend, backendConnected, monitoringData, selectedPatient.id, selectedPatient.name]);
 
   // Navigation handler
   const handleNavigation = useCallback((view) => {
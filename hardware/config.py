@@ -0,0 +1,31 @@
+# config.py
+"""Bedside device settings, read from the environment"""
+import os
+
+# Run against the built-in stand-in device instead of a load cell
+IS_SIMULATION = os.environ.get("SIMULATION_MODE", "true").lower() == "true"
+
+# Backend binary ingest endpoint
+BACKEND_WS_URL = os.environ.get("BACKEND_WS_URL", "ws://localhost:8000/ws/device")
+RECONNECT_SECONDS = float(os.environ.get("RECONNECT_SECONDS", "2"))
+
+# Identity: the numeric id goes in every frame, the patient binding is sent once per connection
+DEVICE_ID = int(os.environ.get("DEVICE_ID", "1"))
+PATIENT_ID = os.environ.get("PATIENT_ID", "test_patient_001")
+
+SAMPLE_INTERVAL_SECONDS = float(os.environ.get("SAMPLE_INTERVAL_SECONDS", "1.0"))
+
+# Frames go out when a batch is full or the oldest pending frame is this old
+BATCH_MAX_FRAMES = int(os.environ.get("BATCH_MAX_FRAMES", "32"))
+BATCH_MAX_DELAY_MS = int(os.environ.get("BATCH_MAX_DELAY_MS", "500"))
+# Unacknowledged frames kept for re-sending (an hour at 1 Hz); oldest are dropped first
+RESEND_BUFFER_FRAMES = int(os.environ.get("RESEND_BUFFER_FRAMES", "3600"))
+
+# HX711 load cell under the collection drape
+HX711_DOUT_PIN = int(os.environ.get("HX711_DOUT_PIN", "5"))
+HX711_SCK_PIN = int(os.environ.get("HX711_SCK_PIN", "6"))
+LOAD_CELL_REFERENCE_UNIT = float(os.environ.get("LOAD_CELL_REFERENCE_UNIT", "1"))  # raw counts per gram
+LOAD_CELL_SAMPLES = int(os.environ.get("LOAD_CELL_SAMPLES", "5"))
+BLOOD_DENSITY_G_ML = float(os.environ.get("BLOOD_DENSITY_G_ML", "1.06"))
+# Smoothing for the bleeding rate reported with each reading
+RATE_EWMA_TAU_SECONDS = float(os.environ.get("RATE_EWMA_TAU_SECONDS", "30"))
@@ -0,0 +1,185 @@
+# main.py
+"""Bedside device: samples blood loss and streams it to the backend.
+
+Readings are packed into binary frames, batched, and sent over one
+persistent WebSocket to /ws/device. Every frame stays in a bounded resend
+buffer until the backend acknowledges it, so readings taken while the
+network is down are delivered after reconnecting.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Dict
+
+import websockets
+
+from config import (
+    BACKEND_WS_URL, BATCH_MAX_DELAY_MS, BATCH_MAX_FRAMES, BLOOD_DENSITY_G_ML, DEVICE_ID,
+    HX711_DOUT_PIN, HX711_SCK_PIN, IS_SIMULATION, LOAD_CELL_REFERENCE_UNIT, LOAD_CELL_SAMPLES,
+    PATIENT_ID, RATE_EWMA_TAU_SECONDS, RECONNECT_SECONDS, RESEND_BUFFER_FRAMES, SAMPLE_INTERVAL_SECONDS,
+)
+from sensors import Ack, LoadCellSensor, LocalDevice, RateTracker, decode_acks, encode_batch, encode_frame
+
+
+class BatchingSender:
+    """Sequence numbering, batching and the resend buffer for one device"""
+
+    def __init__(self, device_id: int, max_frames: int = 32, max_delay_ms: int = 500,
+                 buffer_frames: int = 3600):
+        self.device_id = device_id
+        self.max_frames = max_frames
+        self.max_delay = max_delay_ms / 1000
+        self.buffer_frames = buffer_frames
+        self.next_seq = 1
+        self.dropped = 0
+        self.unacked: "OrderedDict[int, bytes]" = OrderedDict()
+        self.outgoing: deque = deque()
+        self.queued = set()
+        # Per connection: the backend answers every message with exactly one
+        # ack, so counting both tells which frames it has already seen
+        self.messages_sent = 0
+        self.acks_received = 0
+        self.sent_in: Dict[int, int] = {}
+        self._has_pending = asyncio.Event()
+        self._full = asyncio.Event()
+
+    def add(self, ts_ms: int, volume_ml: float, rate_ml_min: float):
+        seq = self.next_seq
+        self.next_seq += 1
+        if len(self.unacked) >= self.buffer_frames:
+            old_seq, _ = self.unacked.popitem(last=False)
+            self.queued.discard(old_seq)
+            self.dropped += 1
+        self.unacked[seq] = encode_frame(self.device_id, seq, ts_ms, volume_ml, rate_ml_min)
+        self._queue(seq)
+
+    def _queue(self, seq: int):
+        if seq in self.queued:
+            return
+        self.queued.add(seq)
+        self.outgoing.append(seq)
+        self._has_pending.set()
+        if len(self.outgoing) >= self.max_frames:
+            self._full.set()
+
+    def reconnected(self):
+        """Queue every unacknowledged frame again, oldest first"""
+        self.outgoing = deque(self.unacked)
+        self.queued = set(self.unacked)
+        self.messages_sent = 0
+        self.acks_received = 0
+        self.sent_in.clear()
+        if self.outgoing:
+            self._has_pending.set()
+
+    async def next_batch(self) -> bytes:
+        """Wait until a batch is full or its oldest frame is max_delay old"""
+        while not self.outgoing:
+            self._has_pending.clear()
+            await self._has_pending.wait()
+        if len(self.outgoing) < self.max_frames:
+            self._full.clear()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+        frames = []
+        while self.outgoing and len(frames) < self.max_frames:
+            seq = self.outgoing.popleft()
+            self.queued.discard(seq)
+            frame = self.unacked.get(seq)
+            if frame is not None:
+                frames.append(frame)
+                self.sent_in[seq] = self.messages_sent + 1
+        if frames:
+            self.messages_sent += 1
+        return encode_batch(frames)
+
+    def acked(self, ack: Ack):
+        """Drop what the backend stored and re-queue gaps it is still missing.
+
+        Only frames up to `ack.highest` are settled; above it the ack may
+        have run out of room for gaps, so those frames stay buffered.
+        """
+        missing = set()
+        for first, last in ack.gaps:
+            missing.update(range(first, last + 1))
+        for seq in [s for s in self.unacked if s <= ack.highest]:
+            if seq <= ack.contiguous or seq not in missing:
+                del self.unacked[seq]
+                self.sent_in.pop(seq, None)
+            elif self.sent_in.get(seq, 0) <= self.acks_received:
+                # Its latest send was already answered, so it really went missing
+                self._queue(seq)
+
+
+async def sample_loop(sensor, sender: BatchingSender, interval: float, rate_tau: float):
+    rates = RateTracker(rate_tau)
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    while True:
+        # The HX711 read blocks for several conversions
+        volume_ml = await asyncio.to_thread(sensor.read_volume_ml)
+        now = time.time()
+        sender.add(int(now * 1000), volume_ml, rates.update(now, volume_ml))
+        next_tick += interval
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+
+async def send_loop(websocket, sender: BatchingSender):
+    while True:
+        batch = await sender.next_batch()
+        if batch:
+            await websocket.send(batch)
+
+
+async def ack_loop(websocket, sender: BatchingSender):
+    async for message in websocket:
+        if isinstance(message, bytes):
+            sender.acks_received += 1
+            for ack in decode_acks(message):
+                if ack.device_id == sender.device_id:
+                    sender.acked(ack)
+        else:
+            print(f"Backend: {message}")
+
+
+async def stream(sender: BatchingSender, url: str, patient_id: str, reconnect_seconds: float):
+    while True:
+        try:
+            async with websockets.connect(url) as websocket:
+                await websocket.send(json.dumps({"type": "bind", "device_id": sender.device_id, "patient_id": patient_id}))
+                sender.reconnected()
+                print(f"Streaming to {url} ({len(sender.unacked)} readings to re-send)")
+                tasks = [asyncio.create_task(send_loop(websocket, sender)),
+                         asyncio.create_task(ack_loop(websocket, sender))]
+                try:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+                finally:
+                    for task in tasks:
+                        task.cancel()
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            print(f"Connection to backend lost: {e}")
+        print(f"Reconnecting in {reconnect_seconds}s ({len(sender.unacked)} unacknowledged, {sender.dropped} dropped)")
+        await asyncio.sleep(reconnect_seconds)
+
+
+async def run():
+    if IS_SIMULATION:
+        sensor = LocalDevice()
+    else:
+        sensor = LoadCellSensor(HX711_DOUT_PIN, HX711_SCK_PIN, LOAD_CELL_REFERENCE_UNIT,
+                                LOAD_CELL_SAMPLES, BLOOD_DENSITY_G_ML)
+    sender = BatchingSender(DEVICE_ID, BATCH_MAX_FRAMES, BATCH_MAX_DELAY_MS, RESEND_BUFFER_FRAMES)
+    print(f"Device {DEVICE_ID} for patient {PATIENT_ID} ({'simulated' if IS_SIMULATION else 'load cell'})")
+    await asyncio.gather(
+        sample_loop(sensor, sender, SAMPLE_INTERVAL_SECONDS, RATE_EWMA_TAU_SECONDS),
+        stream(sender, BACKEND_WS_URL, PATIENT_ID, RECONNECT_SECONDS),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
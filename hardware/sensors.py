@@ -0,0 +1,116 @@
+# sensors.py
+"""Blood-loss sensors and the binary frame format sent to the backend.
+
+The frame layouts must match backend/hardware.py: each reading is one
+24-byte little-endian frame, a message is a batch of frames, and the
+backend answers each message with per-device acks.
+"""
+import math
+import random
+import struct
+import time
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+# device_id u32, seq u32, epoch ms i64, volume_ml f32, rate_ml_min f32
+FRAME = struct.Struct("<IIqff")
+# device_id u32, contiguous seq u32, highest seq covered by the gaps u32, gap count u16
+ACK_HEADER = struct.Struct("<IIIH")
+# first and last missing seq of one gap, inclusive
+ACK_GAP = struct.Struct("<II")
+
+
+class Ack(NamedTuple):
+    device_id: int
+    contiguous: int
+    highest: int
+    gaps: List[Tuple[int, int]]
+
+
+def encode_frame(device_id: int, seq: int, ts_ms: int, volume_ml: float, rate_ml_min: float) -> bytes:
+    return FRAME.pack(device_id, seq, ts_ms, volume_ml, rate_ml_min)
+
+
+def encode_batch(frames: Iterable[bytes]) -> bytes:
+    return b"".join(frames)
+
+
+def decode_acks(payload: bytes) -> List[Ack]:
+    view = memoryview(payload)
+    acks = []
+    offset = 0
+    while offset < len(view):
+        device_id, contiguous, highest, count = ACK_HEADER.unpack_from(view, offset)
+        offset += ACK_HEADER.size
+        gaps = [ACK_GAP.unpack_from(view, offset + i * ACK_GAP.size) for i in range(count)]
+        offset += count * ACK_GAP.size
+        acks.append(Ack(device_id, contiguous, highest, gaps))
+    return acks
+
+
+class RateTracker:
+    """Time-aware EWMA of the bleeding rate from successive volumes.
+
+    Scale noise is symmetric, so the signed rate is smoothed and only the
+    reported value is clamped at zero; clamping each sample would turn the
+    noise into phantom bleeding.
+    """
+
+    def __init__(self, tau_seconds: float = 30):
+        self.tau = tau_seconds
+        self.rate = 0.0
+        self._last: Optional[Tuple[float, float]] = None
+
+    def update(self, now: float, volume_ml: float) -> float:
+        if self._last is not None:
+            last_time, last_volume = self._last
+            dt = now - last_time
+            if dt > 0:
+                instant = (volume_ml - last_volume) * 60 / dt
+                self.rate += (1.0 - math.exp(-dt / self.tau)) * (instant - self.rate)
+        self._last = (now, volume_ml)
+        return max(0.0, self.rate)
+
+
+class LoadCellSensor:
+    """Collected blood volume from an HX711 load cell"""
+
+    def __init__(self, dout_pin: int, sck_pin: int, reference_unit: float,
+                 samples: int = 5, density_g_ml: float = 1.06):
+        from hx711 import HX711  # Only available on the device
+
+        self.samples = samples
+        self.density = density_g_ml
+        self.hx = HX711(dout_pin, sck_pin)
+        self.hx.set_reading_format("MSB", "MSB")
+        self.hx.set_reference_unit(reference_unit)
+        self.hx.reset()
+        # Zero with the empty drape in place
+        self.hx.tare()
+
+    def read_volume_ml(self) -> float:
+        grams = self.hx.get_weight(self.samples)
+        self.hx.power_down()
+        self.hx.power_up()
+        return max(0.0, grams / self.density)
+
+
+class LocalDevice:
+    """Stand-in for a load cell: a steadily bleeding patient with scale noise.
+
+    The true collected volume only grows, at a rate that wanders around
+    `rate_ml_min`; each reading adds independent noise on top of it.
+    """
+
+    def __init__(self, rate_ml_min: float = 5.0, noise_ml: float = 2.0, seed: Optional[int] = None):
+        self.rate_ml_min = rate_ml_min
+        self.noise_ml = noise_ml
+        self.random = random.Random(seed)
+        self.volume = 0.0
+        self._last = time.time()
+
+    def read_volume_ml(self) -> float:
+        now = time.time()
+        rate = self.rate_ml_min * self.random.uniform(0.7, 1.3)
+        self.volume += rate * max(0.0, now - self._last) / 60
+        self._last = now
+        return max(0.0, self.volume + self.random.uniform(-self.noise_ml, self.noise_ml))